@@ -0,0 +1,60 @@
+"""In-process requests/sec benchmark for the hw_1 ASGI app.
+
+Drives ``app`` directly with prepared scopes and no-op send/receive, so the
+numbers measure routing and response building rather than the network.
+
+    python benchmark.py [app_dir] [--requests N]
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+CASES = [
+    ("factorial", "GET", "/factorial", b"n=10", b""),
+    ("fibonacci", "GET", "/fibonacci/10", b"", b""),
+    ("mean", "GET", "/mean", b"", b"[1, 2, 3, 4]"),
+    ("invalid n", "GET", "/fibonacci/lol", b"", b""),
+    ("negative n", "GET", "/factorial", b"n=-1", b""),
+    ("not found", "GET", "/not_found", b"", b""),
+]
+
+
+async def run_case(app, method, path, query, body, requests):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": [(b"content-type", b"application/json")],
+    }
+    message = {"type": "http.request", "body": body, "more_body": False}
+
+    async def receive():
+        return message
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(scope, receive, send)
+    return requests / (time.perf_counter() - start)
+
+
+async def main(requests):
+    from homework_1 import app
+
+    for name, method, path, query, body in CASES:
+        rate = await run_case(app, method, path, query, body, requests)
+        print(f"{name:<12} {rate:>12,.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("app_dir", nargs="?")
+    parser.add_argument("--requests", type=int, default=100_000)
+    args = parser.parse_args()
+    if args.app_dir:
+        sys.path.insert(0, args.app_dir)
+    asyncio.run(main(args.requests))
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class ByteLRUCache:
+    """LRU mapping bounded by the total size of stored values in bytes.
+
+    The caller reports the size of every value on ``put``; least recently used
+    entries are evicted until the total fits into ``max_bytes`` again.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+
+        self._data[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self._data.popitem(last=False)
+            self.size -= evicted_size
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
@@ -0,0 +1,65 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class ExecutorSaturated(Exception):
+    pass
+
+
+class ComputeExecutor:
+    """Runs expensive computations in a process pool and cheap ones inline.
+
+    Calls whose estimated ``cost`` is below ``cost_threshold`` run directly on
+    the event loop. Everything else goes to a lazily started
+    ``ProcessPoolExecutor``; once ``max_pending`` offloaded calls are queued
+    or running, new ones are rejected with ``ExecutorSaturated``.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cost_threshold: int = 5000,
+        max_pending: Optional[int] = None,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cost_threshold = cost_threshold
+        self.max_pending = max_pending or self.max_workers * 4
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls) -> "ComputeExecutor":
+        return cls(
+            max_workers=int(os.environ.get("COMPUTE_WORKERS", 0)) or None,
+            cost_threshold=int(os.environ.get("COMPUTE_COST_THRESHOLD", 5000)),
+            max_pending=int(os.environ.get("COMPUTE_MAX_PENDING", 0)) or None,
+        )
+
+    def is_inline(self, cost: int) -> bool:
+        return cost < self.cost_threshold
+
+    async def run(self, func: Callable[..., Any], *args: Any, cost: int) -> Any:
+        if self.is_inline(cost):
+            return func(*args)
+
+        if self.pending >= self.max_pending:
+            raise ExecutorSaturated()
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
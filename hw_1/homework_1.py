@@ -1,8 +1,46 @@
-from typing import Any, Awaitable, Callable
+from typing import Any, Awaitable, Callable, Optional
+import argparse
 import uvicorn
 import math
+import os
+import sys
+import tempfile
 from pprint import pprint
 import json
+from functools import lru_cache
+from urllib.parse import parse_qsl
+
+from cache import ByteLRUCache
+from executor import ComputeExecutor, ExecutorSaturated
+from serialization import RESULT_FORMATS, SMALL_INT_BITS, encode_int, iter_chunks
+from shared_cache import SharedResultCache
+from singleflight import SingleFlight
+from streaming import (
+    Float64Reducer,
+    JsonArrayParser,
+    RunningStats,
+    StreamError,
+    feed_parser,
+)
+
+
+FIBONACCI_CACHE_BYTES = int(os.environ.get("FIBONACCI_CACHE_BYTES", 64 * 1024 * 1024))
+
+# k -> (F(k), F(k + 1)), shared by final results and fast-doubling steps
+fibonacci_cache = ByteLRUCache(FIBONACCI_CACHE_BYTES)
+
+MEAN_MAX_BODY_BYTES = int(os.environ.get("MEAN_MAX_BODY_BYTES", 64 * 1024 * 1024))
+
+BATCH_OPS = ("factorial", "fibonacci")
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 10_000))
+BATCH_MAX_BODY_BYTES = int(os.environ.get("BATCH_MAX_BODY_BYTES", 1024 * 1024))
+# Fibonacci gaps up to this size are bridged with additions, not doubling
+BATCH_FIBONACCI_MAX_STEPS = 64
+
+executor = ComputeExecutor.from_env()
+singleflight = SingleFlight()
+# Set up by the multi-worker launcher below, None for a single process
+shared_cache = SharedResultCache.from_env()
 
 
 def get_factorial(n):
@@ -14,16 +52,117 @@ def get_factorial(n):
 def get_fibonacci(n):
     if n < 0:
         return None
-    a, b = 0, 1
-    for _ in range(n):
-        a, b = b, a + b
-    return a
+    return get_fibonacci_pair(n)[0]
+
+
+def get_fibonacci_pair(n: int) -> tuple[int, int]:
+    """Return (F(n), F(n + 1)) with fast doubling, reusing cached pairs."""
+    pair = fibonacci_cache.get(n)
+    if pair is not None:
+        return pair
+
+    previous = fibonacci_cache.get(n - 1)
+    if previous is not None:
+        pair = (previous[1], previous[0] + previous[1])
+        _cache_fibonacci_pair(n, pair)
+        return pair
+
+    # Doubling steps for n are its binary prefixes n >> i, so walk down
+    # until one of them is cached and double back up from there.
+    path = []
+    k = n
+    while k and (pair := fibonacci_cache.get(k)) is None:
+        path.append(k)
+        k >>= 1
+
+    a, b = pair if k else (0, 1)
+    for k in reversed(path):
+        c = a * (2 * b - a)
+        d = a * a + b * b
+        a, b = (d, c + d) if k & 1 else (c, d)
+        _cache_fibonacci_pair(k, (a, b))
+    return a, b
+
+
+def _cache_fibonacci_pair(k: int, pair: tuple[int, int]) -> None:
+    fibonacci_cache.put(k, pair, sys.getsizeof(pair[0]) + sys.getsizeof(pair[1]))
+
+
+def range_product(lo: int, hi: int) -> int:
+    """Product of lo..hi inclusive, multiplied as a balanced tree."""
+    if hi - lo < 8:
+        return math.prod(range(lo, hi + 1))
+    mid = (lo + hi) // 2
+    return range_product(lo, mid) * range_product(mid + 1, hi)
+
+
+def extend_factorial(value: int, k: int, n: int) -> int:
+    """n! from value = k!."""
+    return value * range_product(k + 1, n)
+
+
+# Rough cost estimates in executor units (~ factorial(n) for the same n)
+def factorial_cost(n: int) -> int:
+    return n
+
+
+# Extending k! to n! costs about sqrt of the gap's share of a full n!
+def factorial_step_cost(k: int, n: int) -> int:
+    return math.isqrt(factorial_cost(n) * (n - k))
+
+
+def json_parse_cost(size: int) -> int:
+    return size
+
+
+def fibonacci_cost(n: int) -> int:
+    if n in fibonacci_cache or n - 1 in fibonacci_cache:
+        return 0
+    return n // 32
+
+
+async def compute_factorial(n: int) -> Optional[int]:
+    if n < 0:
+        return None
+    cost = factorial_cost(n)
+    if executor.is_inline(cost):
+        return get_factorial(n)
+    return await singleflight.do(("factorial", n), lambda: _run_factorial(n, cost))
+
+
+async def _run_factorial(n: int, cost: int) -> int:
+    key = f"factorial:{n}"
+    if shared_cache is not None and (cached := shared_cache.get(key)) is not None:
+        return cached[0]
 
+    result = await executor.run(get_factorial, n, cost=cost)
+    if shared_cache is not None:
+        shared_cache.put(key, (result,))
+    return result
 
-def get_mean(data: list[float]):
-    if len(data) == 0:
+
+async def compute_fibonacci(n: int) -> Optional[int]:
+    if n < 0:
         return None
-    return sum(data) / len(data)
+    return (await compute_fibonacci_pair(n))[0]
+
+
+async def compute_fibonacci_pair(n: int) -> tuple[int, int]:
+    cost = fibonacci_cost(n)
+    if executor.is_inline(cost):
+        return get_fibonacci_pair(n)
+    return await singleflight.do(("fibonacci", n), lambda: _run_fibonacci_pair(n, cost))
+
+
+async def _run_fibonacci_pair(n: int, cost: int) -> tuple[int, int]:
+    key = f"fibonacci:{n}"
+    pair = shared_cache.get(key) if shared_cache is not None else None
+    if pair is None:
+        pair = await executor.run(get_fibonacci_pair, n, cost=cost)
+        if shared_cache is not None:
+            shared_cache.put(key, pair)
+    _cache_fibonacci_pair(n, pair)
+    return pair
 
 
 async def app(
@@ -32,122 +171,387 @@ async def app(
     send: Callable[[dict[str, Any]], Awaitable[None]],
 ) -> None:
 
-    path = scope["path"]
-    method = scope["method"]
-    path_params = path[1:].split("/")
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
 
-    if not path_params:
-        return await send_response(send, 422, json.dumps({"error": "Invalid path"}))
+    segment, slash, rest = scope["path"][1:].partition("/")
+    handler = ROUTES.get((scope["method"], segment))
+    if handler is None:
+        return await send_prepared(send, NOT_FOUND)
 
-    if method == "GET":
-        if path_params[0] == "factorial":
+    try:
+        return await handler(scope, receive, send, rest if slash else None)
+    except ExecutorSaturated:
+        return await send_prepared(send, SERVER_BUSY)
 
-            try:
-                n = int(scope["query_string"].decode().split("=")[1])
-            except:
-                return await send_response(
-                    send,
-                    422,
-                    json.dumps({"error": "Invalid value for n, must be non-negative"}),
-                )
 
-            result = get_factorial(n)
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            executor.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
 
-            if result == None:
-                return await send_response(
-                    send,
-                    400,
-                    json.dumps({"error": "Invalid value for n, must be non-negative"}),
-                )
 
-            return await send_response(send, 200, json.dumps({"result": result}))
+async def handle_factorial(scope, receive, send, params):
+    query = get_query(scope)
+    try:
+        n = int(query["n"])
+    except:
+        return await send_prepared(send, INVALID_N)
 
-        if path_params[0] == "fibonacci":
-            if len(path_params) < 2:
-                return await send_response(
-                    send, 422, json.dumps({"error": "Invalid param"})
-                )
+    format = query.get("format", "decimal")
+    if format not in RESULT_FORMATS:
+        return await send_prepared(send, INVALID_FORMAT)
 
-            try:
-                n = int(path_params[1])
-            except:
-                return await send_response(
-                    send,
-                    422,
-                    json.dumps({"error": "Inval"}),
-                )
+    if n < 0:
+        return await send_prepared(send, NEGATIVE_N)
 
-            result = get_fibonacci(n)
+    etag = make_etag("factorial", n, format)
+    if etag_matches(scope, etag):
+        return await send_not_modified(send, etag)
 
-            if result == None:
-                return await send_response(
-                    send,
-                    400,
-                    json.dumps({"error": "Invalid value for n, must be non-negative"}),
-                )
+    result = await compute_factorial(n)
+    return await send_result(send, result, format, etag)
 
-            return await send_response(send, 200, json.dumps({"result": result}))
 
-        if path_params[0] == "mean":
+async def handle_fibonacci(scope, receive, send, params):
+    if params is None:
+        return await send_prepared(send, INVALID_PARAM)
 
-            body = await receive_body(receive)
+    try:
+        n = int(params.partition("/")[0])
+    except:
+        return await send_prepared(send, INVALID_FIBONACCI_N)
 
-            try:
-                ar = json.loads(body.decode())
-            except:
-                return await send_response(
-                    send,
-                    422,
-                    json.dumps({"error": "Non json"}),
-                )
+    format = get_query(scope).get("format", "decimal")
+    if format not in RESULT_FORMATS:
+        return await send_prepared(send, INVALID_FORMAT)
 
-            try:
-                ar = [float(x) for x in ar]
-            except:
-                return await send_response(
-                    send,
-                    422,
-                    json.dumps({"error": "Invalid value for n, must be non-negative"}),
+    if n < 0:
+        return await send_prepared(send, NEGATIVE_N)
+
+    etag = make_etag("fibonacci", n, format)
+    if etag_matches(scope, etag):
+        return await send_not_modified(send, etag)
+
+    result = await compute_fibonacci(n)
+    return await send_result(send, result, format, etag)
+
+
+async def handle_mean(scope, receive, send, params):
+    binary = get_content_type(scope) == b"application/octet-stream"
+    with_stats = get_query(scope).get("stats", "").lower() in ("1", "true", "yes")
+    stats = RunningStats(variance=with_stats)
+    parser = Float64Reducer(stats) if binary else JsonArrayParser(stats)
+    try:
+        async for chunk in iter_body(receive, MEAN_MAX_BODY_BYTES):
+            if binary:
+                parser.feed(chunk)
+            else:
+                # the parser travels to a worker and back with its state
+                parser = await executor.run(
+                    feed_parser, parser, chunk, cost=json_parse_cost(len(chunk))
                 )
+        parser.close()
+    except BodyTooLarge:
+        return await send_prepared(send, PAYLOAD_TOO_LARGE)
+    except StreamError as e:
+        return await send_prepared(send, stream_error_response(str(e)))
 
-            result = get_mean(ar)
+    stats = parser.stats
+    result = stats.mean
 
-            if result == None:
-                return await send_response(
-                    send,
-                    400,
-                    json.dumps({"error": "Invalid value for n, must be non-negative"}),
-                )
+    if result == None:
+        return await send_prepared(send, NEGATIVE_N)
+
+    response = {"result": result}
+    if with_stats:
+        response.update(min=stats.min, max=stats.max, variance=stats.variance)
+    return await send_response(send, 200, json.dumps(response).encode())
 
-            return await send_response(send, 200, json.dumps({"result": result}))
 
-    return await send_response(send, 404, json.dumps({"error": "Method not found"}))
+async def handle_stats(scope, receive, send, params):
+    stats = {
+        "singleflight": {
+            "computed": singleflight.computed,
+            "coalesced": singleflight.coalesced,
+        }
+    }
+    return await send_response(send, 200, json.dumps(stats).encode())
 
 
-async def receive_body(receive):
-    body = b""
+async def handle_batch(scope, receive, send, params):
+    try:
+        body = await receive_body(receive, BATCH_MAX_BODY_BYTES)
+    except BodyTooLarge:
+        return await send_prepared(send, PAYLOAD_TOO_LARGE)
+
+    try:
+        pairs = parse_batch(json.loads(body))
+    except ValueError:
+        return await send_prepared(send, INVALID_BATCH)
+
+    return await stream_batch(send, pairs)
+
+
+# (method, first path segment) -> handler(scope, receive, send, rest of path)
+ROUTES = {
+    ("GET", "factorial"): handle_factorial,
+    ("GET", "fibonacci"): handle_fibonacci,
+    ("GET", "mean"): handle_mean,
+    ("GET", "stats"): handle_stats,
+    ("POST", "batch"): handle_batch,
+}
+
+
+def parse_batch(data) -> list[tuple[str, int]]:
+    """Validate [op, n] / {"op", "n"} entries, dedupe and sort them by n."""
+    if not isinstance(data, list) or len(data) > BATCH_MAX_ITEMS:
+        raise ValueError("Invalid batch")
+
+    pairs = set()
+    for entry in data:
+        if isinstance(entry, dict):
+            entry = (entry.get("op"), entry.get("n"))
+        if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+            raise ValueError("Invalid batch")
+        op, n = entry
+        if op not in BATCH_OPS or type(n) is not int or n < 0:
+            raise ValueError("Invalid batch")
+        pairs.add((op, n))
+
+    return sorted(pairs, key=lambda pair: (pair[1], pair[0]))
+
+
+async def stream_batch(send, pairs: list[tuple[str, int]]):
+    """Send results as NDJSON lines, reusing the previous value of each op.
+
+    Factorials close a small gap by multiplying in the missing range and
+    Fibonacci numbers by stepping the (F(k), F(k + 1)) pair; larger jumps
+    are computed from scratch, through the executor when expensive.
+    """
+    await send(
+        {"type": "http.response.start", "status": 200, "headers": NDJSON_HEADERS}
+    )
+
+    factorial_state = (0, 1)
+    fibonacci_state = (0, (0, 1))
+    for op, n in pairs:
+        line = b'{"op": "%s", "n": %d, ' % (op.encode(), n)
+        try:
+            if op == "factorial":
+                k, value = factorial_state
+                if (n - k) * 4 < n:
+                    value = await executor.run(
+                        extend_factorial, value, k, n, cost=factorial_step_cost(k, n)
+                    )
+                else:
+                    value = await compute_factorial(n)
+                factorial_state = (n, value)
+                result = value
+            else:
+                k, (a, b) = fibonacci_state
+                if n - k <= BATCH_FIBONACCI_MAX_STEPS:
+                    for _ in range(n - k):
+                        a, b = b, a + b
+                    _cache_fibonacci_pair(n, (a, b))
+                else:
+                    a, b = await compute_fibonacci_pair(n)
+                fibonacci_state = (n, (a, b))
+                result = a
+            line += b'"result": %s}\n' % await encode_result(result)
+        except ExecutorSaturated:
+            line += b'"error": "Server is busy"}\n'
+
+        await send({"type": "http.response.body", "body": line, "more_body": True})
+
+    await send({"type": "http.response.body", "body": b""})
+
+
+def get_header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def get_content_type(scope) -> Optional[bytes]:
+    value = get_header(scope, b"content-type")
+    if value is None:
+        return None
+    return value.split(b";", 1)[0].strip().lower()
+
+
+def make_etag(route: str, n: int, format: str) -> bytes:
+    """Strong ETag for a result: it only depends on the route, n and format."""
+    return b'"%s-%d-%s"' % (route.encode(), n, format.encode())
+
+
+def etag_matches(scope, etag: bytes) -> bool:
+    value = get_header(scope, b"if-none-match")
+    if value is None:
+        return False
+    for candidate in value.split(b","):
+        candidate = candidate.strip()
+        if candidate == b"*" or candidate.removeprefix(b"W/") == etag:
+            return True
+    return False
+
+
+def get_query(scope) -> dict[str, str]:
+    return dict(parse_qsl(scope["query_string"].decode()))
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def receive_body(receive, max_bytes: Optional[int] = None):
+    return b"".join([chunk async for chunk in iter_body(receive, max_bytes)])
+
+
+async def iter_body(receive, max_bytes: Optional[int] = None):
+    received = 0
     more_body = True
     while more_body:
         message = await receive()
-        body += message.get("body", b"")
+        chunk = message.get("body", b"")
+        received += len(chunk)
+        if max_bytes is not None and received > max_bytes:
+            raise BodyTooLarge()
+        if chunk:
+            yield chunk
         more_body = message.get("more_body", False)
-    return body
 
 
-async def send_response(send, status: int, body: str):
-    await send(
-        {
-            "type": "http.response.start",
-            "status": status,
-            "headers": [
-                [b"content-type", b"application/json"],
-            ],
-        }
+async def send_response(send, status: int, body: bytes):
+    start = OK_START if status == 200 else prepare_start(status)
+    await send(start)
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_result(
+    send, result: int, format: str = "decimal", etag: Optional[bytes] = None
+):
+    start = OK_START
+    if etag is not None:
+        start = prepare_start(200, [*JSON_HEADERS, *cache_headers(etag)])
+    if format == "decimal" and result.bit_length() <= SMALL_INT_BITS:
+        await send(start)
+        await send({"type": "http.response.body", "body": b'{"result": %d}' % result})
+        return
+
+    value = await encode_result(result, format)
+    await send(start)
+    await send({"type": "http.response.body", "body": b'{"result": ', "more_body": True})
+    for chunk in iter_chunks(value):
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b"}"})
+
+
+async def encode_result(result: int, format: str = "decimal") -> bytes:
+    return await executor.run(
+        encode_int, result, format, cost=result.bit_length() // 64
+    )
+
+
+async def send_not_modified(send, etag: bytes):
+    await send(prepare_start(304, cache_headers(etag)))
+    await send(EMPTY_BODY)
+
+
+def cache_headers(etag: bytes) -> list:
+    return [(b"etag", etag), CACHE_CONTROL_HEADER]
+
+
+async def send_prepared(send, response: tuple[dict, dict]):
+    start, body = response
+    await send(start)
+    await send(body)
+
+
+def prepare_start(status: int, headers: list = None) -> dict:
+    return {
+        "type": "http.response.start",
+        "status": status,
+        "headers": headers or JSON_HEADERS,
+    }
+
+
+def prepare_response(status: int, body: dict) -> tuple[dict, dict]:
+    """Encode a constant response once; its messages are sent as is every time."""
+    return (
+        prepare_start(status),
+        {"type": "http.response.body", "body": json.dumps(body).encode()},
+    )
+
+
+@lru_cache(maxsize=None)
+def stream_error_response(message: str) -> tuple[dict, dict]:
+    return prepare_response(422, {"error": message})
+
+
+JSON_HEADERS = [(b"content-type", b"application/json")]
+NDJSON_HEADERS = [(b"content-type", b"application/x-ndjson")]
+# Results are pure functions of the URL, so they may be cached forever
+CACHE_CONTROL_HEADER = (b"cache-control", b"public, max-age=31536000, immutable")
+OK_START = prepare_start(200)
+EMPTY_BODY = {"type": "http.response.body", "body": b""}
+
+INVALID_N = prepare_response(422, {"error": "Invalid value for n, must be non-negative"})
+NEGATIVE_N = prepare_response(400, {"error": "Invalid value for n, must be non-negative"})
+INVALID_PARAM = prepare_response(422, {"error": "Invalid param"})
+INVALID_FIBONACCI_N = prepare_response(422, {"error": "Inval"})
+INVALID_FORMAT = prepare_response(422, {"error": "Invalid format"})
+INVALID_BATCH = prepare_response(422, {"error": "Invalid batch"})
+PAYLOAD_TOO_LARGE = prepare_response(413, {"error": "Payload too large"})
+SERVER_BUSY = prepare_response(503, {"error": "Server is busy"})
+NOT_FOUND = prepare_response(404, {"error": "Method not found"})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256 * 1024 * 1024,
+        help="size of the shared result cache file in bytes",
+    )
+    parser.add_argument(
+        "--cache-path",
+        help="keep the shared result cache in this file across restarts",
     )
-    await send({"type": "http.response.body", "body": body.encode()})
+    args = parser.parse_args()
+
+    if args.workers == 1 and args.cache_path is None:
+        config = uvicorn.Config("homework_1:app", port=args.port, log_level="info")
+        server = uvicorn.Server(config)
+        server.run()
+        return
+
+    cache_path = args.cache_path
+    if cache_path is None:
+        shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, cache_path = tempfile.mkstemp(prefix="hw1-cache-", dir=shm)
+        os.close(fd)
+
+    # workers open the cache themselves when they import this module
+    os.environ["HW1_SHARED_CACHE"] = cache_path
+    os.environ["HW1_SHARED_CACHE_SIZE"] = str(args.cache_size)
+    try:
+        uvicorn.run(
+            "homework_1:app", port=args.port, workers=args.workers, log_level="info"
+        )
+    finally:
+        if args.cache_path is None:
+            os.unlink(cache_path)
 
 
 if __name__ == "__main__":
-    config = uvicorn.Config("homework_1:app", port=8000, log_level="info")
-    server = uvicorn.Server(config)
-    server.run()
+    main()
@@ -1,4 +1,6 @@
 from http import HTTPStatus
+import json
+import sys
 from typing import Any
 
 import pytest
@@ -6,7 +8,8 @@ import requests
 
 
 filename = "homework_1.py"
-BASE_URL = f"http://localhost:8000"
+PORT = 8000
+BASE_URL = f"http://localhost:{PORT}"
 
 
 from multiprocessing import Process
@@ -25,11 +28,16 @@ def run_server():
 @pytest.fixture(scope="session", autouse=True)
 def server():
 
-    proc = Process(target=run_server, args=(), daemon=True)
+    # not a daemon: daemonic processes cannot start the compute process pool
+    proc = Process(target=run_server, args=())
     proc.start()
     time.sleep(2)
     yield
-    proc.kill()
+    # SIGTERM lets uvicorn run the lifespan shutdown, which stops the pool
+    proc.terminate()
+    proc.join(5)
+    if proc.is_alive():
+        proc.kill()
 
 
 @pytest.mark.parametrize(
@@ -101,3 +109,305 @@ def test_mean(json: dict[str, Any], status_code: int):
     assert response.status_code == status_code
     if status_code == HTTPStatus.OK:
         assert "result" in response.json()
+
+
+@pytest.mark.parametrize(
+    ("n", "expected"),
+    [
+        (0, 0),
+        (1, 1),
+        (10, 55),
+        (100, 354224848179261915075),
+    ],
+)
+def test_fibonacci_value(n: int, expected: int):
+    response = requests.get(BASE_URL + f"/fibonacci/{n}")
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["result"] == expected
+
+
+def test_executor_saturated():
+    import asyncio
+    from executor import ComputeExecutor, ExecutorSaturated
+
+    async def run_two():
+        executor = ComputeExecutor(max_workers=1, cost_threshold=1, max_pending=1)
+        try:
+            return await asyncio.gather(
+                executor.run(time.sleep, 0.5, cost=1),
+                executor.run(time.sleep, 0.5, cost=1),
+                executor.run(abs, -1, cost=0),
+                return_exceptions=True,
+            )
+        finally:
+            executor.shutdown()
+
+    first, second, inline = asyncio.run(run_two())
+    assert first is None
+    assert isinstance(second, ExecutorSaturated)
+    assert inline == 1
+
+
+@pytest.mark.parametrize(
+    ("body", "status_code", "expected"),
+    [
+        (b"[1, 2, 3, 4]", HTTPStatus.OK, 2.5),
+        (b'[0.1, 0.2, "0.3"]', HTTPStatus.OK, 0.2),
+        (b"[1e100, 1.0, -1e100]", HTTPStatus.OK, 1 / 3),
+        (b"[1e200, 3]", HTTPStatus.OK, 5e199),
+        (b"[1e200, -1e200]", HTTPStatus.OK, 0.0),
+        (b"[1, 2", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[1, null]", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[1_000]", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[infinity]", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[+5, .5]", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[1, , 2]", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+    ],
+)
+def test_mean_value(body: bytes, status_code: int, expected: float):
+    response = requests.get(
+        BASE_URL + "/mean", data=body, headers={"content-type": "application/json"}
+    )
+
+    assert response.status_code == status_code
+    if status_code == HTTPStatus.OK:
+        assert response.json()["result"] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("content_type", ["application/json", "application/octet-stream"])
+def test_mean_stats_overflow(content_type: str):
+    from array import array
+
+    if content_type == "application/json":
+        body = b"[1e200, -1e200]"
+    else:
+        values = array("d", [1e200, -1e200])
+        if sys.byteorder == "big":
+            values.byteswap()
+        body = values.tobytes()
+
+    response = requests.get(
+        BASE_URL + "/mean",
+        params={"stats": "true"},
+        data=body,
+        headers={"content-type": content_type},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["result"] == 0.0
+    assert response.json()["variance"] == float("inf")
+
+
+def test_mean_chunked():
+    def chunks():
+        yield b"["
+        for i in range(10_000):
+            yield f"{i}, ".encode()
+        yield b"10000]"
+
+    response = requests.get(BASE_URL + "/mean", data=chunks())
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["result"] == pytest.approx(5000.0)
+
+
+def test_mean_large():
+    # big enough for the chunks to be parsed in the process pool
+    body = json.dumps(list(range(200_000))).encode()
+
+    response = requests.get(BASE_URL + "/mean", data=body)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["result"] == pytest.approx(99_999.5)
+
+
+def test_mean_binary():
+    from array import array
+
+    values = array("d", [1.0, 2.0, 3.0, 4.0])
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    response = requests.get(
+        BASE_URL + "/mean",
+        params={"stats": "true"},
+        data=values.tobytes(),
+        headers={"content-type": "application/octet-stream"},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"result": 2.5, "min": 1.0, "max": 4.0, "variance": 1.25}
+
+
+@pytest.mark.parametrize(
+    ("body", "status_code"),
+    [
+        (b"", HTTPStatus.BAD_REQUEST),
+        (b"\x00" * 12, HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+def test_mean_binary_invalid(body: bytes, status_code: int):
+    response = requests.get(
+        BASE_URL + "/mean",
+        data=body,
+        headers={"content-type": "application/octet-stream"},
+    )
+
+    assert response.status_code == status_code
+
+
+def test_batch():
+    response = requests.post(
+        BASE_URL + "/batch",
+        json=[
+            ["fibonacci", 10],
+            {"op": "factorial", "n": 5},
+            ["factorial", 3],
+            ["fibonacci", 10],
+            ["fibonacci", 200],
+            ["factorial", 0],
+        ],
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [
+        {"op": "factorial", "n": 0, "result": 1},
+        {"op": "factorial", "n": 3, "result": 6},
+        {"op": "factorial", "n": 5, "result": 120},
+        {"op": "fibonacci", "n": 10, "result": 55},
+        {"op": "fibonacci", "n": 200, "result": 280571172992510140037611932413038677189525},
+    ]
+
+
+def test_batch_factorial_step():
+    import math
+
+    # the second factorial extends the first one through the process pool
+    response = requests.post(
+        BASE_URL + "/batch", json=[["factorial", 40_000], ["factorial", 42_000]]
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    last = response.text.splitlines()[-1]
+    assert last.startswith('{"op": "factorial", "n": 42000, "result": ')
+    assert int(last[-4001:-1]) == math.factorial(42_000) % 10**4000
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"op": "factorial", "n": 1},
+        [["factorial", -1]],
+        [["power", 2]],
+        [["fibonacci", "10"]],
+        [["fibonacci"]],
+    ],
+)
+def test_batch_invalid(body: Any):
+    response = requests.post(BASE_URL + "/batch", json=body)
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_singleflight_coalesces():
+    import asyncio
+    from singleflight import SingleFlight
+
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def run_many():
+        singleflight = SingleFlight()
+        results = await asyncio.gather(
+            *(singleflight.do(("factorial", 10), compute) for _ in range(10))
+        )
+        return singleflight, results
+
+    singleflight, results = asyncio.run(run_many())
+    assert results == [42] * 10
+    assert calls == 1
+    assert (singleflight.computed, singleflight.coalesced) == (1, 9)
+
+
+def test_stats():
+    response = requests.get(BASE_URL + "/stats")
+
+    assert response.status_code == HTTPStatus.OK
+    assert set(response.json()["singleflight"]) == {"computed", "coalesced"}
+
+
+@pytest.mark.parametrize("format", ["decimal", "hex", "base64"])
+def test_factorial_large(format: str):
+    import base64
+    import math
+
+    n = 20_000
+    response = requests.get(BASE_URL + "/factorial", params={"n": n, "format": format})
+
+    assert response.status_code == HTTPStatus.OK
+    expected = math.factorial(n)
+    if format == "decimal":
+        digits = response.text[len('{"result": ') : -1]
+        assert int(digits[-4000:]) == expected % 10**4000
+        assert len(digits) == 77_338
+    elif format == "hex":
+        assert int(response.json()["result"], 16) == expected
+    else:
+        assert int.from_bytes(base64.b64decode(response.json()["result"]), "big") == expected
+
+
+def test_invalid_format():
+    response = requests.get(BASE_URL + "/fibonacci/10", params={"format": "roman"})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize("path", ["/factorial?n=10", "/fibonacci/10"])
+def test_conditional_get(path: str):
+    response = requests.get(BASE_URL + path)
+
+    assert response.status_code == HTTPStatus.OK
+    etag = response.headers["etag"]
+    assert "immutable" in response.headers["cache-control"]
+
+    response = requests.get(BASE_URL + path, headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    response = requests.get(
+        BASE_URL + path + ("&" if "?" in path else "?") + "format=hex",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["etag"] != etag
+
+
+def test_shared_cache(tmp_path):
+    import math
+    from shared_cache import SharedResultCache
+
+    path = str(tmp_path / "cache")
+    writer = SharedResultCache(path, 64 * 1024)
+    reader = SharedResultCache(path, 64 * 1024)
+
+    writer.put("factorial:1000", (math.factorial(1000),))
+    writer.put("fibonacci:10", (55, 89))
+    assert reader.get("factorial:1000") == (math.factorial(1000),)
+    assert reader.get("fibonacci:10") == (55, 89)
+    assert reader.get("fibonacci:11") is None
+
+    # the ring wraps instead of growing, old entries are dropped
+    for n in range(200):
+        writer.put(f"factorial:{n + 2000}", (math.factorial(n + 2000),))
+    assert reader.get("factorial:1000") is None
+    assert reader.get("factorial:2199") == (math.factorial(2199),)
+    assert (tmp_path / "cache").stat().st_size == 64 * 1024
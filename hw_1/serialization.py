@@ -0,0 +1,66 @@
+import base64
+import decimal
+from typing import Iterator
+
+# Ints up to this size are formatted with plain %d: well below the default
+# int-to-str digit limit (4300 digits) and too small to profit from splitting.
+SMALL_INT_BITS = 8192
+RESPONSE_CHUNK_BYTES = 64 * 1024
+
+RESULT_FORMATS = ("decimal", "hex", "base64")
+
+
+def int_to_decimal_string(n: int) -> str:
+    """Subquadratic int -> decimal string conversion, free of the digit limit.
+
+    n is split in halves by bits and rebuilt as a ``decimal.Decimal`` whose
+    big multiplications are fast; formatting the Decimal is then linear.
+    """
+    if n.bit_length() <= SMALL_INT_BITS:
+        return "%d" % n
+
+    powers_of_two: dict[int, decimal.Decimal] = {}
+
+    def power_of_two(w: int) -> decimal.Decimal:
+        result = powers_of_two.get(w)
+        if result is None:
+            if w <= SMALL_INT_BITS:
+                result = decimal.Decimal(1 << w)
+            else:
+                half = w >> 1
+                result = power_of_two(half) * power_of_two(w - half)
+            powers_of_two[w] = result
+        return result
+
+    def convert(n: int, w: int) -> decimal.Decimal:
+        if w <= SMALL_INT_BITS:
+            return decimal.Decimal(n)
+        half = w >> 1
+        hi = n >> half
+        lo = n - (hi << half)
+        return convert(lo, half) + convert(hi, w - half) * power_of_two(half)
+
+    with decimal.localcontext() as context:
+        context.prec = decimal.MAX_PREC
+        context.Emax = decimal.MAX_EMAX
+        context.Emin = decimal.MIN_EMIN
+        context.traps[decimal.Inexact] = True
+        if n < 0:
+            return "-" + str(convert(-n, n.bit_length()))
+        return str(convert(n, n.bit_length()))
+
+
+def encode_int(n: int, format: str = "decimal") -> bytes:
+    """JSON value for n: a number, or a "0x..." / base64 string of its bytes."""
+    if format == "hex":
+        return b'"%s"' % hex(n).encode()
+    if format == "base64":
+        raw = n.to_bytes(max(1, (n.bit_length() + 7) // 8), "big")
+        return b'"%s"' % base64.b64encode(raw)
+    return int_to_decimal_string(n).encode()
+
+
+def iter_chunks(data: bytes, size: int = RESPONSE_CHUNK_BYTES) -> Iterator[bytes]:
+    view = memoryview(data)
+    for start in range(0, len(view), size):
+        yield bytes(view[start : start + size])
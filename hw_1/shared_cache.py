@@ -0,0 +1,158 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from typing import Optional
+
+MAGIC = b"HW1CACHE"
+VERSION = 1
+
+# magic, version, slot count, data size, write position, last stamp
+HEADER = struct.Struct("<8sIIQQQ")
+# key hash, record offset, payload length, stamp
+SLOT = struct.Struct("<QQQQ")
+# stamp, key hash, payload length, payload crc32
+RECORD = struct.Struct("<QQQI")
+LENGTH = struct.Struct("<Q")
+
+HEADER_SIZE = 64
+SLOT_BYTES_RATIO = 4096
+
+
+class SharedResultCache:
+    """Cross-process cache of integer tuples in one mmap'd file.
+
+    The file holds a direct-mapped index of key hashes followed by a ring
+    buffer of records. New records overwrite the oldest ones when the ring
+    wraps and index collisions replace the previous entry, so the file never
+    grows. Every record carries its key, a stamp and a CRC, which lets
+    readers detect entries that have been overwritten. Access is serialized
+    between processes with ``flock``.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            self._init_layout(size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedResultCache"]:
+        path = os.environ.get("HW1_SHARED_CACHE")
+        if not path:
+            return None
+        return cls(path, int(os.environ["HW1_SHARED_CACHE_SIZE"]))
+
+    def _init_layout(self, size: int) -> None:
+        slot_count = max(1, size // SLOT_BYTES_RATIO)
+        data_start = HEADER_SIZE + slot_count * SLOT.size
+        if data_start >= size:
+            raise ValueError("Shared cache size is too small")
+
+        magic, version, slots, data_size, _, _ = HEADER.unpack_from(self._map, 0)
+        self.slot_count = slot_count
+        self.data_start = data_start
+        self.data_size = size - data_start
+        if (magic, version, slots, data_size) != (
+            MAGIC,
+            VERSION,
+            slot_count,
+            self.data_size,
+        ):
+            self._map[:data_start] = bytes(data_start)
+            HEADER.pack_into(
+                self._map, 0, MAGIC, VERSION, slot_count, self.data_size, 0, 0
+            )
+
+    def get(self, key: str) -> Optional[tuple[int, ...]]:
+        key_hash = _hash_key(key)
+        slot_offset = HEADER_SIZE + key_hash % self.slot_count * SLOT.size
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        try:
+            slot_hash, offset, length, stamp = SLOT.unpack_from(self._map, slot_offset)
+            if slot_hash != key_hash or stamp == 0:
+                return None
+            if offset + RECORD.size + length > self.data_size:
+                return None
+            record = RECORD.unpack_from(self._map, self.data_start + offset)
+            start = self.data_start + offset + RECORD.size
+            payload = self._map[start : start + length]
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        if record != (stamp, key_hash, length, zlib.crc32(payload)):
+            return None
+        return _decode(payload)
+
+    def put(self, key: str, value: tuple[int, ...]) -> None:
+        payload = _encode(value)
+        record_size = RECORD.size + len(payload)
+        if record_size > self.data_size:
+            return
+
+        key_hash = _hash_key(key)
+        slot_offset = HEADER_SIZE + key_hash % self.slot_count * SLOT.size
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            magic, version, slots, data_size, position, stamp = HEADER.unpack_from(
+                self._map, 0
+            )
+            if position + record_size > self.data_size:
+                position = 0
+            stamp += 1
+
+            start = self.data_start + position
+            RECORD.pack_into(
+                self._map, start, stamp, key_hash, len(payload), zlib.crc32(payload)
+            )
+            self._map[start + RECORD.size : start + record_size] = payload
+            SLOT.pack_into(self._map, slot_offset, key_hash, position, len(payload), stamp)
+            HEADER.pack_into(
+                self._map,
+                0,
+                magic,
+                version,
+                slots,
+                data_size,
+                position + record_size,
+                stamp,
+            )
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+def _hash_key(key: str) -> int:
+    # hash() is salted per process, the cache is shared between processes
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def _encode(value: tuple[int, ...]) -> bytes:
+    parts = []
+    for n in value:
+        raw = n.to_bytes((n.bit_length() + 7) // 8, "little")
+        parts.append(LENGTH.pack(len(raw)))
+        parts.append(raw)
+    return b"".join(parts)
+
+
+def _decode(payload: bytes) -> tuple[int, ...]:
+    values = []
+    position = 0
+    while position < len(payload):
+        (length,) = LENGTH.unpack_from(payload, position)
+        position += LENGTH.size
+        values.append(int.from_bytes(payload[position : position + length], "little"))
+        position += length
+    return tuple(values)
@@ -0,0 +1,269 @@
+import json
+import math
+import re
+import sys
+from array import array
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class StreamError(ValueError):
+    pass
+
+
+class RunningStats:
+    """Running aggregates of a stream of floats, fed chunk summaries.
+
+    Each ``merge`` folds in one chunk's count, sum, min, max and sum of
+    squared deviations. The mean comes from a compensated (Neumaier) sum
+    of the chunk sums; the population variance combines the chunks with
+    the pairwise (Chan) update.
+    """
+
+    def __init__(self, variance: bool = True):
+        self.tracks_variance = variance
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._sum = 0.0
+        self._compensation = 0.0
+        self._running_mean = 0.0
+        self._m2 = 0.0
+
+    def merge(
+        self, count: int, total: float, minimum: float, maximum: float, m2: float
+    ) -> None:
+        if count == 0:
+            return
+        self._add_to_sum(total)
+        chunk_mean = total / count
+        merged = self.count + count
+        delta = chunk_mean - self._running_mean
+        self._running_mean += delta * count / merged
+        self._m2 += m2 + delta * delta * self.count * count / merged
+        self.count = merged
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def _add_to_sum(self, x: float) -> None:
+        total = self._sum + x
+        if abs(self._sum) >= abs(x):
+            self._compensation += (self._sum - total) + x
+        else:
+            self._compensation += (x - total) + self._sum
+        self._sum = total
+
+    @property
+    def sum(self) -> float:
+        return self._sum + self._compensation
+
+    @property
+    def mean(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+    @property
+    def variance(self) -> Optional[float]:
+        if self.count == 0 or not self.tracks_variance:
+            return None
+        return self._m2 / self.count
+
+
+class Float64Reducer:
+    """Folds a raw little-endian float64 stream into ``stats`` chunk by chunk.
+
+    Each chunk is viewed in place (NumPy when installed, otherwise a
+    ``memoryview`` cast) and reduced with vectorized sum/min/max; at most
+    seven bytes of a split value are carried over to the next chunk.
+    """
+
+    def __init__(self, stats: RunningStats):
+        self.stats = stats
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> None:
+        if self._tail:
+            chunk = self._tail + chunk
+        cut = len(chunk) - len(chunk) % 8
+        self._tail = chunk[cut:]
+        if cut:
+            self.stats.merge(
+                *_reduce_float64(memoryview(chunk)[:cut], self.stats.tracks_variance)
+            )
+
+    def close(self) -> None:
+        if self._tail:
+            raise StreamError("Body length must be a multiple of 8 bytes")
+
+
+def _summarize(values, variance: bool) -> tuple[int, float, float, float, float]:
+    if not values:
+        return 0, 0.0, math.inf, -math.inf, 0.0
+    total = _fsum(values)
+    m2 = 0.0
+    if variance:
+        mean = total / len(values)
+        # d * d overflows to inf, unlike d ** 2 which raises OverflowError
+        m2 = _fsum([d * d for d in (x - mean for x in values)])
+    return len(values), total, min(values), max(values), m2
+
+
+def _fsum(values) -> float:
+    try:
+        return math.fsum(values)
+    except (OverflowError, ValueError):
+        # fsum refuses inf - inf and overflowing partials; let them turn into nan/inf
+        return sum(values)
+
+
+if np is not None:
+
+    def _reduce_float64(
+        buffer: memoryview, variance: bool
+    ) -> tuple[int, float, float, float, float]:
+        values = np.frombuffer(buffer, dtype="<f8")
+        total = float(values.sum())
+        m2 = 0.0
+        if variance:
+            with np.errstate(over="ignore", invalid="ignore"):
+                m2 = float(np.square(values - total / len(values)).sum())
+        return len(values), total, float(values.min()), float(values.max()), m2
+
+else:
+
+    def _reduce_float64(
+        buffer: memoryview, variance: bool
+    ) -> tuple[int, float, float, float, float]:
+        values = buffer.cast("d")
+        if sys.byteorder == "big":
+            values = array("d", values)
+            values.byteswap()
+        return _summarize(values, variance)
+
+
+_TOKEN = re.compile(
+    rb'[ \t\r\n]*(?:([\[\],])|("(?:[^"\\]|\\.)*")'
+    rb'|(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?(?![^ \t\r\n\[\],"]))'
+    rb'|([^ \t\r\n\[\],"]+))'
+)
+_WHITESPACE = re.compile(rb"[ \t\r\n]*")
+# Anything json.loads must not see in a run of plain values
+_RUN_STOP = re.compile(rb'["\[\]]')
+
+_START, _FIRST_VALUE, _VALUE, _SEPARATOR, _DONE = range(5)
+
+
+class JsonArrayParser:
+    """Incremental parser for a flat JSON array of numbers.
+
+    Chunks are parsed as they arrive and each chunk's elements are folded
+    into ``stats`` at once; only an unfinished trailing token is kept between
+    chunks. Runs of plain comma-separated values are decoded by ``json.loads``
+    in one call, the tokenizer only handles brackets, strings and chunk edges.
+    Elements are converted like ``float(x)`` would convert the value
+    ``json.loads`` decoded, so numeric strings and booleans are accepted too,
+    while bare literals must follow the JSON number grammar.
+    """
+
+    def __init__(self, stats: RunningStats):
+        self.stats = stats
+        self._state = _START
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> None:
+        self._parse(self._tail + chunk if self._tail else chunk, final=False)
+
+    def close(self) -> None:
+        self._parse(self._tail, final=True)
+        if self._state != _DONE:
+            raise StreamError("Non json")
+
+    def _parse(self, data: bytes, final: bool) -> None:
+        values = []
+        pos = 0
+        end = len(data)
+        while True:
+            if self._state in (_FIRST_VALUE, _VALUE):
+                pos = self._decode_run(data, pos, values)
+            match = _TOKEN.match(data, pos)
+            if match is None:
+                rest = _WHITESPACE.match(data, pos).end()
+                if rest == end:
+                    self._tail = b""
+                    break
+                if not final and data[rest : rest + 1] == b'"':
+                    self._tail = data[rest:]
+                    break
+                raise StreamError("Non json")
+
+            punctuation, string, number, literal = match.groups()
+            unfinished = punctuation is None and string is None and match.end() == end
+            if unfinished and not final:
+                self._tail = data[match.start(3 if number is not None else 4) :]
+                break
+            pos = match.end()
+
+            if punctuation == b"[" and self._state == _START:
+                self._state = _FIRST_VALUE
+            elif punctuation == b"]" and self._state in (_FIRST_VALUE, _SEPARATOR):
+                self._state = _DONE
+            elif punctuation == b"," and self._state == _SEPARATOR:
+                self._state = _VALUE
+            elif punctuation is None and self._state in (_FIRST_VALUE, _VALUE):
+                if number is not None:
+                    values.append(float(number))
+                else:
+                    values.append(_to_float(string, literal))
+                self._state = _SEPARATOR
+            else:
+                raise StreamError("Non json")
+        self.stats.merge(*_summarize(values, self.stats.tracks_variance))
+
+    def _decode_run(self, data: bytes, pos: int, values: list) -> int:
+        """Decode the values up to the last comma before a string or bracket."""
+        stop = _RUN_STOP.search(data, pos)
+        cut = data.rfind(b",", pos, stop.start() if stop else len(data))
+        if cut < 0:
+            return pos
+        try:
+            run = json.loads(b"[" + data[pos:cut] + b"]", parse_constant=_reject_constant)
+        except ValueError:
+            raise StreamError("Non json")
+        # "[ ,1]" decodes as an empty run, every comma must have had a value before it
+        if len(run) != data.count(b",", pos, cut) + 1:
+            raise StreamError("Non json")
+        try:
+            values.extend([float(x) for x in run])
+        except (TypeError, OverflowError):
+            raise StreamError("Invalid value for n, must be non-negative")
+        self._state = _VALUE
+        return cut + 1
+
+
+def feed_parser(parser, chunk: bytes):
+    """Feed ``chunk`` to ``parser`` and return it, so a pool worker can do it."""
+    parser.feed(chunk)
+    return parser
+
+
+def _reject_constant(name: str):
+    raise ValueError(f"{name} is not a JSON number")
+
+
+def _to_float(string: Optional[bytes], literal: Optional[bytes]) -> float:
+    if literal == b"true":
+        return 1.0
+    if literal == b"false":
+        return 0.0
+    if literal is not None and literal != b"null":
+        raise StreamError("Non json")
+    try:
+        # null is valid JSON, but float(None) is not
+        return float(json.loads(string) if string is not None else None)
+    except (TypeError, ValueError):
+        raise StreamError("Invalid value for n, must be non-negative")
@@ -0,0 +1,70 @@
+"""Memory and listing-time benchmark for the hw_2 item stores.
+
+Fills each store with the same items and reports the memory they hold
+(tracemalloc) and the time of a few ``list_items`` filters.
+
+    python benchmark.py [--items N] [--repeat R]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from columnar import ColumnarStore
+from schemas import ItemCreate
+from store import Store
+
+FILTERS = [
+    ("first page", {}),
+    ("price range", {"min_price": 400.0, "max_price": 600.0}),
+    ("deep offset", {"offset": 10_000, "min_price": 100.0}),
+    ("with deleted", {"show_deleted": True, "max_price": 900.0}),
+]
+
+
+def fill(store, items):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for item_data in items:
+        store.create_item(item_data)
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, elapsed
+
+
+def time_filter(store, params, repeat):
+    params = {"offset": 0, "limit": 10, **params}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        store.list_items(**params)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(count, repeat):
+    rng = random.Random(0)
+    names = [f"product {i}" for i in range(10_000)]
+    items = [
+        ItemCreate(
+            name=rng.choice(names),
+            price=round(rng.uniform(1, 1000), 2),
+            deleted=rng.random() < 0.1,
+        )
+        for _ in range(count)
+    ]
+
+    for name, store in (("store", Store()), ("columnar", ColumnarStore())):
+        size, elapsed = fill(store, items)
+        print(f"{name:<10} {size / 2**20:>9.1f} MiB  filled in {elapsed:.1f} s")
+        for filter_name, params in FILTERS:
+            seconds = time_filter(store, params, repeat)
+            print(f"  {filter_name:<14} {seconds * 1000:>9.3f} ms")
+        del store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.items, args.repeat)
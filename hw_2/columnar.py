@@ -0,0 +1,224 @@
+from array import array
+from heapq import nsmallest
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import metrics
+from fast_json import FragmentCache
+from indexes import TrigramIndex
+from schemas import Item
+from store import Store
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Состояние строки: id ещё не выдан (или выдан, но товар не записан), товар есть, товар удалён
+MISSING, LIVE, DELETED = -1, 0, 1
+
+
+class ItemColumns:
+    """Items kept column-wise and keyed by id, instead of one Item per entry.
+
+    Ids are dense, so row ``id - 1`` of each typed array holds one item:
+    its price, its state and the position of its name in a table of
+    interned names. Reads behave like a dict of Items, but each Item is
+    built on access, so only the rows that are returned ever become models.
+
+    ``name_index`` maps name trigrams to positions in the names table, so
+    name search costs memory per distinct name rather than per item.
+    """
+
+    def __init__(self):
+        self.prices = array("d")
+        self.states = array("b")
+        self.name_ids = array("i")
+        self.names: List[str] = []
+        self._name_ids: Dict[str, int] = {}
+        self.name_index = TrigramIndex()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, id: int) -> bool:
+        return 0 < id <= len(self.states) and self.states[id - 1] != MISSING
+
+    def __iter__(self) -> Iterator[int]:
+        return (row + 1 for row, state in enumerate(self.states) if state != MISSING)
+
+    def __getitem__(self, id: int) -> Item:
+        if id not in self:
+            raise KeyError(id)
+        return self._item(id - 1)
+
+    def __setitem__(self, id: int, item: Item) -> None:
+        row = id - 1
+        missing = row + 1 - len(self.states)
+        if missing > 0:
+            self.prices.extend(array("d", [0.0]) * missing)
+            self.states.extend(array("b", [MISSING]) * missing)
+            self.name_ids.extend(array("i", [0]) * missing)
+        if self.states[row] == MISSING:
+            self._count += 1
+        self.prices[row] = item.price
+        self.states[row] = DELETED if item.deleted else LIVE
+        self.name_ids[row] = self._intern(item.name)
+
+    def get(self, id: int, default: Optional[Item] = None) -> Optional[Item]:
+        return self._item(id - 1) if id in self else default
+
+    def values(self) -> Iterator[Item]:
+        return (self._item(id - 1) for id in self)
+
+    def select(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        show_deleted: bool = False,
+        after: Optional[Tuple[float, int]] = None,
+        name_ids: Optional[Set[int]] = None,
+    ) -> List[Item]:
+        """Page of items ordered by (price, id), filtered column-wise.
+
+        ``name_ids`` keeps only rows whose name is one of these, e.g. a
+        ``name_index`` search result.
+        """
+        select_rows = _select_rows_numpy if np is not None else _select_rows
+        rows = select_rows(
+            self, offset + limit, min_price, max_price, show_deleted, after, name_ids
+        )
+        return [self._item(row) for row in rows[offset:]]
+
+    def _intern(self, name: str) -> int:
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+            self.name_index.add(name_id, name)
+        return name_id
+
+    def _item(self, row: int) -> Item:
+        return Item(
+            id=row + 1,
+            name=self.names[self.name_ids[row]],
+            price=self.prices[row],
+            deleted=self.states[row] == DELETED,
+        )
+
+
+def _select_rows_numpy(
+    columns: ItemColumns,
+    count: int,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    show_deleted: bool,
+    after: Optional[Tuple[float, int]],
+    name_ids: Optional[Set[int]],
+) -> List[int]:
+    """First ``count`` matching rows in (price, id) order.
+
+    The numpy views share memory with the arrays and block their resizing,
+    so they must not outlive the caller's read lock; returning a plain list
+    from here drops them.
+    """
+    prices = np.frombuffer(columns.prices, dtype=np.float64)
+    states = np.frombuffer(columns.states, dtype=np.int8)
+    mask = states != MISSING if show_deleted else states == LIVE
+    if name_ids is not None:
+        wanted = np.fromiter(name_ids, dtype=np.intc, count=len(name_ids))
+        mask &= np.isin(np.frombuffer(columns.name_ids, dtype=np.intc), wanted)
+    if min_price is not None:
+        mask &= prices >= min_price
+    if max_price is not None:
+        mask &= prices <= max_price
+    rows = np.flatnonzero(mask)
+    if after is not None:
+        after_price, after_id = after
+        row_prices = prices[rows]
+        rows = rows[(row_prices > after_price) | ((row_prices == after_price) & (rows >= after_id))]
+
+    row_prices = prices[rows]
+    if len(rows) > count:
+        # цена count-й по порядку строки; все строки с такой же ценой оставляем,
+        # чтобы порядок по id внутри неё решила сортировка
+        threshold = np.partition(row_prices, count - 1)[count - 1]
+        keep = row_prices <= threshold
+        rows, row_prices = rows[keep], row_prices[keep]
+    return rows[np.lexsort((rows, row_prices))][:count].tolist()
+
+
+def _select_rows(
+    columns: ItemColumns,
+    count: int,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    show_deleted: bool,
+    after: Optional[Tuple[float, int]],
+    name_ids: Optional[Set[int]],
+) -> List[int]:
+    after = (-float("inf"), 0) if after is None else (after[0], after[1] - 1)
+    candidates = (
+        (price, row)
+        for row, price, state in (
+            (row, columns.prices[row], columns.states[row]) for row in range(len(columns.states))
+        )
+        if (state == LIVE or (show_deleted and state == DELETED))
+        and (name_ids is None or columns.name_ids[row] in name_ids)
+        and (min_price is None or price >= min_price)
+        and (max_price is None or price <= max_price)
+        and (price, row) > after
+    )
+    return [row for _, row in nsmallest(count, candidates)]
+
+
+class ColumnarStore(Store):
+    """Store keeping its items in ItemColumns.
+
+    Listing scans the columns (vectorized when numpy is installed) instead
+    of walking the sorted price index, which this store doesn't keep.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.items = ItemColumns()
+        # Item собираются заново при каждом чтении, кэшировать нечего
+        self.item_json = FragmentCache(keep=False)
+
+    def list_items(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        show_deleted: bool = False,
+        after: Optional[Tuple[float, int]] = None,
+        name_contains: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+    ) -> List[Item]:
+        with self._items_lock.read():
+            name_ids = (
+                self.items.name_index.search(name_contains, name_prefix)
+                if name_contains or name_prefix
+                else None
+            )
+            # фильтр проходит по всем строкам колонок, в том числе при поиске по имени
+            metrics.observe_scan("list_items", len(self.items.states))
+            return self.items.select(
+                offset, limit, min_price, max_price, show_deleted, after, name_ids
+            )
+
+    def _insert_item(self, item: Item) -> None:
+        self._index_item(item)
+        self.stats.item_changed(None, item)
+
+    def _insert_items(self, items: List[Item]) -> None:
+        for item in items:
+            self._insert_item(item)
+
+    def _index_item(self, item: Item) -> None:
+        # строка колонок и есть индекс: перезаписываем её, в том числе при удалении;
+        # имена ищутся по триграммам таблицы имён, а не по товарам
+        self.items[item.id] = item
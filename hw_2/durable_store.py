@@ -0,0 +1,198 @@
+import glob
+import os
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+
+from schemas import Item, CartItem, Cart
+from store import Store
+from wal import (
+    OP_CART,
+    OP_CART_ADD,
+    OP_ITEM,
+    WriteAheadLog,
+    decode_record,
+    read_log,
+    read_snapshot,
+    write_snapshot,
+)
+
+SNAPSHOT_FILE = "snapshot.bin"
+LOG_FILE = "wal-{}.log"
+
+
+class DurableStore(Store):
+    """In-memory Store persisted through a write-ahead log and snapshots.
+
+    The directory holds ``snapshot.bin`` with generation N and
+    ``wal-N.log`` with every mutation made after it. Once the log grows
+    past ``snapshot_bytes``, the log switches to ``wal-N+1.log`` and a
+    background thread writes snapshot N + 1, so recovery is one mmap-ed
+    snapshot read plus a short replay instead of the whole history.
+
+    Until that snapshot is renamed into place, both logs are needed:
+    recovery replays every log from the snapshot's generation on.
+    """
+
+    # каждая запись ждёт fsync журнала
+    blocking = True
+
+    def __init__(self, directory: str, snapshot_bytes: int = 64 * 2**20):
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._snapshot_bytes = snapshot_bytes
+        self._snapshot_lock = Lock()
+        # строки корзин, изменённых после переключения журнала, пока снимок собирается
+        self._pending_carts: Optional[Dict[int, tuple]] = None
+
+        snapshot_generation, items, carts = read_snapshot(self._snapshot_path)
+        self._load(items, carts)
+        del items, carts
+        # журнал N + 1 с записями есть, если снимок N + 1 не успел дописаться
+        generation = snapshot_generation
+        payloads, valid_size = read_log(self._log_path(generation))
+        while True:
+            for payload in payloads:
+                self._replay(decode_record(payload))
+            if not os.path.exists(self._log_path(generation + 1)):
+                break
+            generation += 1
+            payloads, valid_size = read_log(self._log_path(generation))
+        self._generation = generation
+        log_path = self._log_path(generation)
+        self._wal = WriteAheadLog(log_path, valid_size)
+        # журналы старше снимка остаются, если процесс упал между rename и их удалением
+        for path in glob.glob(os.path.join(directory, LOG_FILE.format("*"))):
+            if path != log_path and _log_generation(path) < snapshot_generation:
+                os.remove(path)
+        if generation != snapshot_generation:
+            self.snapshot()
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self._directory, SNAPSHOT_FILE)
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self._directory, LOG_FILE.format(generation))
+
+    def snapshot(self) -> None:
+        """Write a snapshot of the current state and start an empty log."""
+        with self._snapshot_lock:
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        """Switch the log and write the state it starts from, holding _snapshot_lock.
+
+        Under the exclusive items lock only the log switch and shallow
+        copies of items and carts happen, so every request is held up for
+        little more than an fsync. Items are never changed in place, so
+        the copied list keeps their state at the switch; carts are, so the
+        first change to each one saves its row in ``_pending_carts`` while
+        the rows are being collected.
+        """
+        with self._items_lock.write():
+            old_wal = self._wal
+            old_wal.close()
+            generation = self._generation + 1
+            self._wal = WriteAheadLog(self._log_path(generation), seq=old_wal.seq)
+            self._generation = generation
+            items = list(self.items.values())
+            carts = list(self.carts.values())
+            self._pending_carts = {}
+        try:
+            item_rows = [(item.id, item.name, item.price, item.deleted) for item in items]
+            cart_rows = []
+            for cart in carts:
+                with self._cart_locks[cart.id]:
+                    row = self._pending_carts.get(cart.id)
+                    cart_rows.append(_cart_row(cart) if row is None else row)
+        finally:
+            self._pending_carts = None
+        del items, carts
+        write_snapshot(self._snapshot_path, item_rows, cart_rows, generation)
+        # снимок на месте: журналы до него больше не нужны
+        for path in glob.glob(os.path.join(self._directory, LOG_FILE.format("*"))):
+            if _log_generation(path) < generation:
+                os.remove(path)
+
+    def _cart_changing(self, cart: Cart) -> None:
+        pending = self._pending_carts
+        if pending is not None and cart.id not in pending:
+            pending[cart.id] = _cart_row(cart)
+
+    def _snapshot_in_background(self) -> None:
+        try:
+            self._snapshot()
+        finally:
+            self._snapshot_lock.release()
+
+    def close(self) -> None:
+        # дожидаемся снимка, который пишется в фоне
+        with self._snapshot_lock:
+            self._wal.close()
+
+    def _sync(self, seq: int) -> None:
+        super()._sync(seq)
+        if (
+            seq
+            and self._wal.size >= self._snapshot_bytes
+            and self._snapshot_lock.acquire(blocking=False)
+        ):
+            Thread(target=self._snapshot_in_background, name="hw2-snapshot").start()
+
+    def _load(self, items: List[Item], carts: List[tuple]) -> None:
+        for item in items:
+            self.items[item.id] = item
+            self.item_names.add(item.id, item.name)
+        self.stats.load(items, [price for _, price, _ in carts])
+        self.items_by_price.load(
+            {item.id: item.price for item in items if not item.deleted}
+        )
+        self.deleted_items_by_price.load(
+            {item.id: item.price for item in items if item.deleted}
+        )
+        if items:
+            self._item_ids.advance(max(self.items))
+
+        for cart_id, price, lines in carts:
+            cart_items = []
+            for item_id, quantity in lines:
+                item = self.items[item_id]
+                cart_items.append(
+                    CartItem(
+                        id=item_id, name=item.name, quantity=quantity, available=not item.deleted
+                    )
+                )
+                self.item_carts.setdefault(item_id, set()).add(cart_id)
+            self.carts[cart_id] = Cart(id=cart_id, items=cart_items, price=price)
+            self._cart_locks[cart_id] = Lock()
+        self.carts_by_price.load({cart.id: cart.price for cart in self.carts.values()})
+        self.carts_by_quantity.load(
+            {cart.id: cart.total_quantity for cart in self.carts.values()}
+        )
+        if carts:
+            self._cart_ids.advance(max(self.carts))
+
+    def _replay(self, record: tuple) -> None:
+        op = record[0]
+        if op == OP_ITEM:
+            item = record[1]
+            self._item_ids.advance(item.id)
+            old_item = self.items.get(item.id)
+            if old_item is None:
+                self._insert_item(item)
+            else:
+                self._replace_item(old_item, item)
+        elif op == OP_CART:
+            self._cart_ids.advance(record[1])
+            self._insert_cart(Cart(id=record[1], items=[]))
+        elif op == OP_CART_ADD:
+            self.add_to_cart(record[1], record[2])
+
+
+def _log_generation(path: str) -> int:
+    return int(os.path.basename(path)[len("wal-"):-len(".log")])
+
+
+def _cart_row(cart: Cart) -> tuple:
+    return cart.id, cart.price, [(line.id, line.quantity) for line in cart.items]
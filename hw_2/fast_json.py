@@ -0,0 +1,112 @@
+import json
+import time
+from typing import Any, Dict, Iterable, Tuple
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Вне этого диапазона orjson пишет float иначе, чем json.dumps (1e16 против 1e+16)
+FLOAT_MIN, FLOAT_MAX = 1e-4, 1e16
+
+
+def dumps(model: BaseModel) -> bytes:
+    """JSON of a model, byte for byte what FastAPI's JSONResponse renders.
+
+    orjson is used when every value in the model is one it formats like
+    ``json.dumps``; other floats and non-finite values take the json path.
+    """
+    start = time.perf_counter()
+    data = model.model_dump()
+    if orjson is not None and _orjson_matches(data):
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(
+            model.model_dump(mode="json"),
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode()
+    metrics.observe_serialization("fast_json", time.perf_counter() - start)
+    return body
+
+
+def _orjson_matches(value: Any) -> bool:
+    if isinstance(value, float):
+        return value == 0 or FLOAT_MIN <= abs(value) < FLOAT_MAX
+    if isinstance(value, dict):
+        return all(_orjson_matches(item) for item in value.values())
+    if isinstance(value, list):
+        return all(_orjson_matches(item) for item in value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return -2**63 <= value < 2**64
+    return True
+
+
+class FragmentCache:
+    """Serialized JSON of entities by id, dropped whenever an entity changes.
+
+    A fragment is reused only for the very object it was made from, so a
+    reader still holding an entity that has since been replaced never
+    caches it. Writers that change an entity in place call ``invalidate``
+    afterwards; a reader that serialized it meanwhile sees the version move
+    and drops its fragment. Stores that build a new object on every read
+    pass ``keep=False``, since nothing could ever be reused.
+    """
+
+    def __init__(self, keep: bool = True):
+        self._keep = keep
+        self._fragments: Dict[int, Tuple[BaseModel, bytes]] = {}
+        self._versions: Dict[int, int] = {}
+
+    def invalidate(self, id: int) -> None:
+        self._versions[id] = self._versions.get(id, 0) + 1
+        self._fragments.pop(id, None)
+
+    def fragment(self, entity: BaseModel) -> bytes:
+        if not self._keep:
+            return dumps(entity)
+        cached = self._fragments.get(entity.id)
+        if cached is not None and cached[0] is entity:
+            return cached[1]
+        version = self._versions.get(entity.id, 0)
+        fragment = dumps(entity)
+        self._fragments[entity.id] = (entity, fragment)
+        if self._versions.get(entity.id, 0) != version:
+            self._fragments.pop(entity.id, None)
+        return fragment
+
+    def join(self, entities: Iterable[BaseModel]) -> bytes:
+        return b"[" + b",".join(map(self.fragment, entities)) + b"]"
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse reporting how long rendering its body took."""
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = super().render(content)
+        metrics.observe_serialization("json_response", time.perf_counter() - start)
+        return body
+
+
+class FastJSONResponse(Response):
+    """Response for a body that is already serialized JSON."""
+
+    media_type = "application/json"
+
+
+def fast_json_response(response: Response, body: bytes) -> FastJSONResponse:
+    """Wrap body, keeping the headers a handler set on its ``response``."""
+    headers = {
+        name: value for name, value in response.headers.items() if name != "content-length"
+    }
+    return FastJSONResponse(body, status_code=response.status_code or 200, headers=headers)
@@ -0,0 +1,159 @@
+import math
+import sys
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+
+class SortedIndex:
+    """Secondary index keeping ids ordered by (key, id).
+
+    Range lookups are two binary searches, and a page of a range is a list
+    slice, so reading ``limit`` ids costs O(log n + limit) at any offset.
+    """
+
+    def __init__(self):
+        self._entries: List[Tuple[float, int]] = []
+        self._keys: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._keys
+
+    def add(self, id: int, key: float) -> None:
+        if id in self._keys:
+            self.remove(id)
+        self._keys[id] = key
+        insort(self._entries, (key, id))
+
+    def load(self, keys: Dict[int, float]) -> None:
+        """Replace the contents with one sort instead of an insort per id."""
+        self._keys = dict(keys)
+        self._entries = sorted((key, id) for id, key in self._keys.items())
+
+    def add_many(self, keys: Dict[int, float]) -> None:
+        """Add a batch of new ids with one merge instead of an insort each."""
+        for id in keys.keys() & self._keys.keys():
+            self.remove(id)
+        self._keys.update(keys)
+        # timsort сливает два уже упорядоченных куска за линейное время
+        self._entries += sorted((key, id) for id, key in keys.items())
+        self._entries.sort()
+
+    def key(self, id: int) -> Optional[float]:
+        return self._keys.get(id)
+
+    def remove(self, id: int) -> None:
+        key = self._keys.pop(id, None)
+        if key is None:
+            return
+        del self._entries[bisect_left(self._entries, (key, id))]
+
+    def bounds(
+        self, min_key: Optional[float] = None, max_key: Optional[float] = None
+    ) -> Tuple[int, int]:
+        """Positions [start, end) of the entries with min_key <= key <= max_key."""
+        start = 0 if min_key is None else bisect_left(self._entries, (min_key,))
+        end = (
+            len(self._entries)
+            if max_key is None
+            else bisect_right(self._entries, (max_key, math.inf))
+        )
+        return start, max(start, end)
+
+    def position_after(self, key: float, id: int) -> int:
+        """Position of the first entry ordered after (key, id)."""
+        return bisect_right(self._entries, (key, id))
+
+    def entries(self, start: int, end: int) -> List[Tuple[float, int]]:
+        return self._entries[start:end]
+
+    def iter_entries(self, start: int, end: int) -> Iterator[Tuple[float, int]]:
+        """Lazy ``entries``, for scans that may stop early."""
+        for position in range(start, min(end, len(self._entries))):
+            yield self._entries[position]
+
+
+# Имена дополняются двумя такими символами в начале, чтобы первые триграммы
+# отвечали и на поиск по префиксу из одного-двух символов
+TRIGRAM_PAD = "\x00"
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from casefolded name trigrams to ids.
+
+    Postings are kept per distinct casefolded name, not per id, so many
+    ids under few names cost one posting entry per name and trigram. A
+    substring search intersects the posting sets of the query trigrams,
+    smallest first, checks the few names left and returns the ids under
+    them, so no Item is read to find the matches.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}
+        self._ids: Dict[str, Set[int]] = {}
+        self._names: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, id: int, name: str) -> None:
+        # один объект строки на имя, сколько бы id под ним ни лежало
+        folded = sys.intern(name.casefold())
+        if self._names.get(id) is folded:
+            return
+        self.remove(id)
+        self._names[id] = folded
+        ids = self._ids.get(folded)
+        if ids is None:
+            ids = self._ids[folded] = set()
+            for trigram in trigrams(TRIGRAM_PAD * 2 + folded):
+                self._postings.setdefault(trigram, set()).add(folded)
+        ids.add(id)
+
+    def remove(self, id: int) -> None:
+        folded = self._names.pop(id, None)
+        if folded is None:
+            return
+        ids = self._ids[folded]
+        ids.discard(id)
+        if ids:
+            return
+        del self._ids[folded]
+        for trigram in trigrams(TRIGRAM_PAD * 2 + folded):
+            postings = self._postings[trigram]
+            postings.discard(folded)
+            if not postings:
+                del self._postings[trigram]
+
+    def search(self, contains: Optional[str] = None, prefix: Optional[str] = None) -> Set[int]:
+        """Ids whose name contains ``contains`` and starts with ``prefix``, ignoring case."""
+        contains = contains.casefold() if contains else ""
+        prefix = prefix.casefold() if prefix else ""
+        query_trigrams = trigrams(contains)
+        if prefix:
+            query_trigrams |= trigrams(TRIGRAM_PAD * 2 + prefix)
+
+        if query_trigrams:
+            postings = sorted(
+                (self._postings.get(trigram, set()) for trigram in query_trigrams), key=len
+            )
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates &= posting
+        else:
+            # запрос короче триграммы: остаётся проверить все имена
+            candidates = self._ids.keys()
+
+        ids: Set[int] = set()
+        for name in candidates:
+            if contains in name and name.startswith(prefix):
+                ids |= self._ids[name]
+        return ids
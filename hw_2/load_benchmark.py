@@ -0,0 +1,191 @@
+"""Concurrent-client benchmark: async handlers against threadpool handlers.
+
+Serves each app from its own uvicorn process and drives it over real
+sockets from ``clients`` concurrent keep-alive connections, then reports
+throughput, latency percentiles and the most requests the app had in
+flight at once. The client is a minimal asyncio HTTP/1.1 loop: httpx's
+connection pool is itself the bottleneck at a thousand connections.
+The threadpool baseline is a twin of the benchmarked routes written as
+sync ``def`` over the same store, i.e. what hw_2 served before the
+handlers became ``async def``.
+
+    python load_benchmark.py [--clients N] [--requests R]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from http import HTTPStatus
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+
+import main
+from fast_json import TimedJSONResponse
+from schemas import Cart, Item, ItemCreate
+
+ITEM_COUNT = 1000
+INFLIGHT_PATH = "/_inflight"
+
+
+class InFlight:
+    """ASGI wrapper counting the requests the app is handling at once."""
+
+    def __init__(self, app):
+        self.app = app
+        self.current = 0
+        self.peak = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if scope["path"] == INFLIGHT_PATH:
+            body = str(self.peak).encode()
+            headers = [(b"content-length", str(len(body)).encode())]
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            return await send({"type": "http.response.body", "body": body})
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.current -= 1
+
+
+def seed() -> None:
+    for i in range(ITEM_COUNT):
+        main.store.create_item(ItemCreate(name=f"item {i}", price=float(i + 1)))
+    main.store.create_cart()
+
+
+def async_app():
+    seed()
+    return InFlight(main.app)
+
+
+def threadpool_app():
+    seed()
+    # те же middleware и класс ответа, что у main.app: разница только в def
+    app = FastAPI(default_response_class=TimedJSONResponse)
+    if main.Instrumentator is not None:
+        from prometheus_client import CollectorRegistry
+
+        main.Instrumentator(registry=CollectorRegistry()).instrument(app)
+
+    @app.get("/item/{id}", response_model=Item)
+    def get_item(id: int):
+        item = main.store.get_item(id)
+        if not item:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Item not found")
+        return item
+
+    @app.get("/item", response_model=List[Item])
+    def get_items(limit: int = 10):
+        return main.store.list_items(0, limit)
+
+    @app.post("/cart/{cart_id}/add/{item_id}", response_model=Cart)
+    def add_item_to_cart(cart_id: int, item_id: int):
+        return main.store.add_to_cart(cart_id, [(item_id, 1)])
+
+    return InFlight(app)
+
+
+def requests_for(client_id: int, count: int):
+    for i in range(count):
+        item_id = (client_id + i) % ITEM_COUNT + 1
+        kind = i % 3
+        if kind == 0:
+            yield "GET", f"/item/{item_id}"
+        elif kind == 1:
+            yield "GET", "/item?limit=10"
+        else:
+            yield "POST", f"/cart/1/add/{item_id}"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(factory: str, port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", f"load_benchmark:{factory}", "--factory",
+            "--port", str(port), "--log-level", "warning", "--backlog", "4096",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+
+
+async def fetch(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: 0\r\n\r\n".encode())
+    status_line, *headers = (await reader.readuntil(b"\r\n\r\n")).decode().split("\r\n")
+    length = next(
+        int(value) for name, _, value in (header.partition(":") for header in headers)
+        if name.lower() == "content-length"
+    )
+    body = await reader.readexactly(length)
+    return int(status_line.split()[1]), body
+
+
+async def run(port: int, clients: int, count: int):
+    latencies: List[float] = []
+
+    async def client_loop(client_id: int) -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for method, path in requests_for(client_id, count):
+                start = time.perf_counter()
+                status, body = await fetch(reader, writer, method, path)
+                latencies.append(time.perf_counter() - start)
+                assert status == HTTPStatus.OK, body
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(client_id) for client_id in range(clients)))
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    _, peak = await fetch(reader, writer, "GET", INFLIGHT_PATH)
+    writer.close()
+
+    latencies.sort()
+    return (
+        len(latencies) / elapsed,
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)],
+        int(peak),
+    )
+
+
+def main_(clients: int, count: int) -> None:
+    for name, factory in (("threadpool", "threadpool_app"), ("async", "async_app")):
+        port = free_port()
+        server = serve(factory, port)
+        try:
+            rate, p50, p99, peak = asyncio.run(run(port, clients, count))
+        finally:
+            server.terminate()
+            server.wait()
+        print(
+            f"{name:<11} {rate:>7,.0f} req/s  p50 {p50 * 1000:>7.1f} ms"
+            f"  p99 {p99 * 1000:>7.1f} ms  peak in flight {peak}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    main_(args.clients, args.requests)
@@ -1,141 +1,210 @@
-from fastapi import FastAPI, HTTPException, Query, Response
+import os
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import NonNegativeInt, PositiveInt, PositiveFloat
-from typing import List, Dict, Optional, Annotated
+from typing import Callable, Iterator, List, Optional, Annotated, TypeVar
+from itertools import islice
 from http import HTTPStatus
-from schemas import ItemCreate, ItemPatch, Item, CartItem, Cart
+from schemas import ItemCreate, ItemPatch, Item, CartItemAdd, Cart, Stats
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from fast_json import FastJSONResponse, TimedJSONResponse, dumps, fast_json_response
+from repository import NotFoundError, create_repository
+import metrics
+
+try:
+    from prometheus_fastapi_instrumentator import Instrumentator
+except ImportError:
+    Instrumentator = None
+
+T = TypeVar("T")
+
+app = FastAPI(default_response_class=TimedJSONResponse)
+store = create_repository()
+
+# /metrics: гистограммы задержек по маршрутам и метрики хранилища
+if Instrumentator is not None:
+    Instrumentator().instrument(app).expose(app, include_in_schema=False)
+    metrics.register_store(store)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+EXPORT_CHUNK_SIZE = 256
+
+# Отдавать GET-ответы из кэша сериализованных сущностей, минуя response_model
+FAST_JSON = os.environ.get("HW2_FAST_JSON", "") == "1"
+
+
+async def run(method: Callable[..., T], *args) -> T:
+    """Call a store method from an async handler.
 
-app = FastAPI()
+    In-memory stores answer on the event loop: their critical sections
+    never await, so their thread locks are held only for the call itself.
+    Stores that block on I/O (SQLite queries, WAL fsync) go to the
+    threadpool instead.
+    """
+    if store.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+@app.exception_handler(NotFoundError)
+async def not_found_handler(request: Request, exc: NotFoundError):
+    return JSONResponse(status_code=HTTPStatus.NOT_FOUND, content={"detail": exc.detail})
 
-items: Dict[int, Item] = {}
-carts: Dict[int, Cart] = {}
 
 # CRUD для товаров
 @app.post("/item", response_model=Item, status_code=HTTPStatus.CREATED)
-def create_item(item_data: ItemCreate):
-    item_id = len(items) + 1
-    new_item = Item.from_item(item_data, item_id)
-    items[item_id] = new_item
-    return new_item
+async def create_item(item_data: ItemCreate):
+    return await run(store.create_item, item_data)
+
+
+@app.post("/item/batch", response_model=List[Item], status_code=HTTPStatus.CREATED)
+async def create_items(items_data: List[ItemCreate]):
+    return await run(store.create_items, items_data)
+
+
+# Объявлен раньше /item/{id}, иначе "export" разбирался бы как id
+@app.get("/item/export")
+async def export_items():
+    return StreamingResponse(iter_ndjson(store.iter_items()), media_type=NDJSON_MEDIA_TYPE)
+
+
+def iter_ndjson(items: Iterator[Item]) -> Iterator[bytes]:
+    """Items as NDJSON, EXPORT_CHUNK_SIZE lines per chunk.
+
+    Lines are serialized directly rather than through ``store.item_json``,
+    which would keep a fragment of every exported item.
+    """
+    while True:
+        chunk = [dumps(item) + b"\n" for item in islice(items, EXPORT_CHUNK_SIZE)]
+        if not chunk:
+            return
+        yield b"".join(chunk)
 
 
 @app.get("/item/{id}", response_model=Item)
-def get_item(id: int):
-    item = items.get(id)
-    if not item or item.deleted:
+async def get_item(id: int):
+    item = await run(store.get_item, id)
+    if not item:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Item not found")
+    if FAST_JSON:
+        return FastJSONResponse(store.item_json.fragment(item))
     return item
 
 
 @app.get("/item", response_model=List[Item])
-def get_items(
+async def get_items(
+    response: Response,
     offset: Annotated[NonNegativeInt, Query()] = 0,
     limit: Annotated[PositiveInt, Query()] = 10,
     min_price: Annotated[Optional[PositiveFloat], Query()] = None,
     max_price: Annotated[Optional[PositiveFloat], Query()] = None,
     show_deleted: Annotated[bool, Query()] = False,
+    cursor: Annotated[Optional[str], Query()] = None,
+    name_contains: Annotated[Optional[str], Query(min_length=1)] = None,
+    name_prefix: Annotated[Optional[str], Query(min_length=1)] = None,
 ):
-    filtered_items = [
-        item for item in items.values()
-        if (show_deleted or not item.deleted) and
-           (min_price is None or item.price >= min_price) and
-           (max_price is None or item.price <= max_price)
-    ]
-    return filtered_items[offset : offset + limit]
+    after = decode_cursor(cursor, (float, int)) if cursor is not None else None
+    page = await run(
+        store.list_items,
+        offset,
+        limit,
+        min_price,
+        max_price,
+        show_deleted,
+        after,
+        name_contains,
+        name_prefix,
+    )
+    if len(page) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page[-1].price, page[-1].id)
+    if FAST_JSON:
+        return fast_json_response(response, store.item_json.join(page))
+    return page
 
 
 @app.put("/item/{id}", response_model=Item)
-def update_item(id: int, item_data: ItemCreate):
-    item = items.get(id)
-    if not item or item.deleted:
+async def update_item(id: int, item_data: ItemCreate):
+    item = await run(store.update_item, id, item_data)
+    if not item:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Item not found")
-
-    updated_item = Item.from_item(item_data, id)
-    items[id] = updated_item
-    return updated_item
+    return item
 
 
 @app.patch("/item/{id}", response_model=Item)
-def patch_item(id: int, item_data: ItemPatch):
-    item = items.get(id)
-    if not item or item.deleted:
+async def patch_item(id: int, item_data: ItemPatch):
+    item = await run(store.patch_item, id, item_data)
+    if not item:
         raise HTTPException(status_code=HTTPStatus.NOT_MODIFIED, detail="Item not found")
-
-    updated_item = item.model_copy(update=item_data.model_dump())
-    items[id] = updated_item
-    return updated_item
+    return item
 
 
 @app.delete("/item/{id}", response_model=Item)
-def delete_item(id: int):
-    item = items.get(id)
+async def delete_item(id: int):
+    item = await run(store.delete_item, id)
     if not item:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Item not found")
-    item.deleted = True
     return item
 
 
 
 @app.post("/cart", status_code=HTTPStatus.CREATED)
-def create_cart(response: Response):
-    cart_id = len(carts) + 1
-    new_cart = Cart(id=cart_id, items=[])
-    carts[cart_id] = new_cart
-    response.headers["Location"] = f"/cart/{cart_id}"
-    return {"id": cart_id}
+async def create_cart(response: Response):
+    cart = await run(store.create_cart)
+    response.headers["Location"] = f"/cart/{cart.id}"
+    return {"id": cart.id}
 
 
 @app.get("/cart/{id}", response_model=Cart)
-def get_cart(id: int):
-    cart = carts.get(id)
+async def get_cart(id: int):
+    cart = await run(store.get_cart, id)
     if not cart:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Cart not found")
+    if FAST_JSON:
+        return FastJSONResponse(store.cart_json.fragment(cart))
     return cart
 
 
 @app.get("/cart", response_model=List[Cart])
-def get_carts(
+async def get_carts(
+    response: Response,
     offset: Annotated[NonNegativeInt, Query()] = 0,
     limit: Annotated[PositiveInt, Query()] = 10,
     min_price: Annotated[Optional[PositiveFloat], Query()] = None,
     max_price: Annotated[Optional[PositiveFloat], Query()] = None,
     min_quantity: Annotated[Optional[NonNegativeInt], Query()] = None,
     max_quantity: Annotated[Optional[NonNegativeInt], Query()] = None,
+    cursor: Annotated[Optional[str], Query()] = None,
 ):
-    filtered_carts = []
-    for i, cart in enumerate(carts.values()):
-        if not (offset <= i < offset + limit):
-            continue
-
-        cart_total_quantity = sum(item.quantity for item in cart.items)
-        if (
-            (min_price is not None and cart.price < min_price) or
-            (max_price is not None and cart.price > max_price) or
-            (min_quantity is not None and cart_total_quantity < min_quantity) or
-            (max_quantity is not None and cart_total_quantity > max_quantity)
-        ):
-            continue
-
-        filtered_carts.append(cart)
-
-    return filtered_carts
+    after = decode_cursor(cursor, (int, float, int)) if cursor is not None else None
+    try:
+        order, page = await run(
+            store.list_carts, offset, limit, min_price, max_price, min_quantity, max_quantity, after
+        )
+    except ValueError:
+        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail="Invalid cursor")
+
+    if len(page) == limit:
+        key, cart = page[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(order, key, cart.id)
+    carts = [cart for _, cart in page]
+    if FAST_JSON:
+        return fast_json_response(response, store.cart_json.join(carts))
+    return carts
 
 
 @app.post("/cart/{cart_id}/add/{item_id}", response_model=Cart)
-def add_item_to_cart(cart_id: int, item_id: int):
-    cart = carts.get(cart_id)
-    item = items.get(item_id)
+async def add_item_to_cart(cart_id: int, item_id: int):
+    return await run(store.add_to_cart, cart_id, [(item_id, 1)])
 
-    if not cart:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Cart not found")
-    if not item or item.deleted:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Item not found")
 
-    for cart_item in cart.items:
-        if cart_item.id == item.id:
-            cart_item.quantity += 1
-            cart.price += item.price
-            return cart
+@app.post("/cart/{cart_id}/add", response_model=Cart)
+async def add_items_to_cart(cart_id: int, lines: List[CartItemAdd]):
+    return await run(store.add_to_cart, cart_id, [(line.id, line.quantity) for line in lines])
 
-    cart.items.append(CartItem(id=item.id, name=item.name, quantity=1, available=True))
-    cart.price += item.price
-    return cart
+
+# Статистика для дашбордов, без обхода товаров и корзин
+@app.get("/stats", response_model=Stats)
+async def get_stats():
+    return await run(store.get_stats)
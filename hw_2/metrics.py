@@ -0,0 +1,65 @@
+from typing import Iterator
+
+try:
+    import prometheus_client
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    prometheus_client = None
+
+# Границы для числа просмотренных записей: от точечного чтения до полного обхода
+COUNT_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+SECONDS_BUCKETS = (1e-6, 5e-6, 2.5e-5, 1e-4, 5e-4, 2.5e-3, 1e-2, 5e-2, 0.25)
+
+if prometheus_client is not None:
+    SCANNED_ENTITIES = prometheus_client.Histogram(
+        "hw2_store_scanned_entities",
+        "Items or carts the store read to answer one listing call.",
+        ["operation"],
+        buckets=COUNT_BUCKETS,
+    )
+    CART_LINES_SCANNED = prometheus_client.Histogram(
+        "hw2_store_cart_lines_scanned",
+        "Cart lines the store read for one add_to_cart call.",
+        buckets=COUNT_BUCKETS,
+    )
+    SERIALIZATION_SECONDS = prometheus_client.Histogram(
+        "hw2_serialization_seconds",
+        "Time spent rendering JSON, by encoder.",
+        ["encoder"],
+        buckets=SECONDS_BUCKETS,
+    )
+
+
+def observe_scan(operation: str, count: int) -> None:
+    if prometheus_client is not None:
+        SCANNED_ENTITIES.labels(operation).observe(count)
+
+
+def observe_cart_lines(count: int) -> None:
+    if prometheus_client is not None:
+        CART_LINES_SCANNED.observe(count)
+
+
+def observe_serialization(encoder: str, seconds: float) -> None:
+    if prometheus_client is not None:
+        SERIALIZATION_SECONDS.labels(encoder).observe(seconds)
+
+
+class StoreCollector:
+    """Store sizes, read from its running totals on every scrape."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def collect(self) -> Iterator["GaugeMetricFamily"]:
+        stats = self._store.get_stats()
+        items = GaugeMetricFamily("hw2_store_items", "Items in the store.", labels=["state"])
+        items.add_metric(["live"], stats.live_items)
+        items.add_metric(["deleted"], stats.deleted_items)
+        yield items
+        yield GaugeMetricFamily("hw2_store_carts", "Carts in the store.", value=stats.open_carts)
+
+
+def register_store(store) -> None:
+    if prometheus_client is not None:
+        prometheus_client.REGISTRY.register(StoreCollector(store))
@@ -0,0 +1,42 @@
+import base64
+import json
+import math
+from typing import Tuple, Type
+
+from fastapi import HTTPException
+from http import HTTPStatus
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*position: float) -> str:
+    """Opaque cursor for keyset pagination: the sort key of the last row."""
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, slots: Tuple[Type, ...]) -> Tuple[float, ...]:
+    """Position from ``encode_cursor``; ``slots`` are the types of its values.
+
+    Floats must be finite and int slots (cart order, ids) must hold integers,
+    anything else is an invalid cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        if (
+            isinstance(position, list)
+            and len(position) == len(slots)
+            and all(_fits(value, slot) for value, slot in zip(position, slots))
+        ):
+            return tuple(position)
+    except ValueError:
+        pass
+    raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail="Invalid cursor")
+
+
+def _fits(value, slot: Type) -> bool:
+    # bool — подкласс int, но в курсоре это ошибка
+    if type(value) is int:
+        return True
+    return slot is float and type(value) is float and math.isfinite(value)
@@ -0,0 +1,138 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Tuple
+
+from fast_json import FragmentCache
+from schemas import ItemCreate, ItemPatch, Item, Cart, Stats
+
+# Порядок выдачи корзин, записывается в курсор
+CART_ORDER_ID, CART_ORDER_PRICE, CART_ORDER_QUANTITY = range(3)
+
+STORAGE_ENV = "HW2_STORAGE"
+SQLITE_PATH_ENV = "HW2_SQLITE_PATH"
+DATA_DIR_ENV = "HW2_DATA_DIR"
+SNAPSHOT_BYTES_ENV = "HW2_SNAPSHOT_BYTES"
+
+
+class NotFoundError(Exception):
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class Repository(ABC):
+    """Storage for items and carts used by the API handlers.
+
+    Item lookups return None for missing (or deleted) items; cart writes
+    raise NotFoundError. Implementations must be safe to call from the
+    FastAPI threadpool.
+
+    ``item_json`` and ``cart_json`` hold serialized entities for the fast
+    JSON responses; implementations invalidate them on every change.
+    """
+
+    # Методы ждут диска или базы и не должны вызываться из цикла событий
+    blocking = False
+
+    def __init__(self):
+        self.item_json = FragmentCache()
+        self.cart_json = FragmentCache()
+
+    @abstractmethod
+    def create_item(self, item_data: ItemCreate) -> Item: ...
+
+    @abstractmethod
+    def create_items(self, items_data: List[ItemCreate]) -> List[Item]:
+        """Insert a batch of items under one range of consecutive ids."""
+
+    @abstractmethod
+    def iter_items(self) -> Iterator[Item]:
+        """Every item, deleted ones included, in id order and without a full copy."""
+
+    @abstractmethod
+    def get_item(self, id: int) -> Optional[Item]: ...
+
+    @abstractmethod
+    def list_items(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        show_deleted: bool = False,
+        after: Optional[Tuple[float, int]] = None,
+        name_contains: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+    ) -> List[Item]:
+        """Items ordered by (price, id), optionally after a cursor position.
+
+        ``name_contains`` and ``name_prefix`` match the casefolded name.
+        """
+
+    @abstractmethod
+    def update_item(self, id: int, item_data: ItemCreate) -> Optional[Item]: ...
+
+    @abstractmethod
+    def patch_item(self, id: int, item_data: ItemPatch) -> Optional[Item]: ...
+
+    @abstractmethod
+    def delete_item(self, id: int) -> Optional[Item]: ...
+
+    @abstractmethod
+    def create_cart(self) -> Cart: ...
+
+    @abstractmethod
+    def get_cart(self, id: int) -> Optional[Cart]: ...
+
+    @abstractmethod
+    def list_carts(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_quantity: Optional[int] = None,
+        max_quantity: Optional[int] = None,
+        after: Optional[Tuple[int, float, int]] = None,
+    ) -> Tuple[int, List[Tuple[float, Cart]]]:
+        """Filtered page of carts as (order, [(sort key, cart)]).
+
+        ``after`` is a (order, key, id) position from a previous page; it is
+        rejected with ValueError if these filters pick a different order.
+        """
+
+    @abstractmethod
+    def add_to_cart(self, cart_id: int, lines: List[Tuple[int, int]]) -> Cart:
+        """Add (item_id, quantity) lines to a cart, all or nothing."""
+
+    @abstractmethod
+    def get_stats(self) -> Stats:
+        """Catalog and cart totals, kept up to date by every mutation rather than scanned."""
+
+
+def create_repository() -> Repository:
+    """Build the backend named by HW2_STORAGE.
+
+    "memory" (default), "columnar", "wal" or "sqlite".
+    """
+    backend = os.environ.get(STORAGE_ENV, "memory")
+    if backend == "memory":
+        from store import Store
+
+        return Store()
+    if backend == "columnar":
+        from columnar import ColumnarStore
+
+        return ColumnarStore()
+    if backend == "wal":
+        from durable_store import DurableStore
+
+        return DurableStore(
+            os.environ.get(DATA_DIR_ENV, "hw2_data"),
+            int(os.environ.get(SNAPSHOT_BYTES_ENV, 64 * 2**20)),
+        )
+    if backend == "sqlite":
+        from sqlite_store import SqliteStore
+
+        return SqliteStore(os.environ.get(SQLITE_PATH_ENV, "hw2.sqlite3"))
+    raise ValueError(f"Unknown {STORAGE_ENV} backend: {backend!r}")
@@ -1,7 +1,7 @@
 from typing import Optional
 
 from fastapi import FastAPI, HTTPException, Query, Response
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 from typing import List, Dict, Optional, Annotated
 from uuid import uuid4
 from pydantic import NonNegativeInt, PositiveInt, PositiveFloat
@@ -36,6 +36,13 @@ class Item(BaseModel):
         )
 
 
+class CartItemAdd(BaseModel):
+    id: int
+    quantity: PositiveInt = 1
+
+    model_config = ConfigDict(extra="forbid")
+
+
 class CartItem(BaseModel):
     id: int
     name: str
@@ -46,4 +53,43 @@ class CartItem(BaseModel):
 class Cart(BaseModel):
     id: int
     items: List[CartItem]
-    price: float = 0.0
\ No newline at end of file
+    price: float = 0.0
+
+    # Сумма quantity по всем позициям, ведётся при добавлении товаров
+    _total_quantity: int = PrivateAttr(default=0)
+    # item_id -> позиция из items, для поиска позиции за O(1)
+    _lines: Dict[int, CartItem] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context) -> None:
+        self._lines = {line.id: line for line in self.items}
+        self._total_quantity = sum(line.quantity for line in self.items)
+
+    def get_line(self, item_id: int) -> Optional[CartItem]:
+        return self._lines.get(item_id)
+
+    def add_line(self, line: CartItem) -> None:
+        self.items.append(line)
+        self._lines[line.id] = line
+
+    @property
+    def total_quantity(self) -> int:
+        return self._total_quantity
+
+    @total_quantity.setter
+    def total_quantity(self, value: int) -> None:
+        self._total_quantity = value
+
+
+class PriceBucket(BaseModel):
+    # верхняя граница цены (включительно), None у последней корзины
+    le: Optional[float]
+    count: int
+
+
+class Stats(BaseModel):
+    live_items: int
+    deleted_items: int
+    price_histogram: List[PriceBucket]
+    # корзины не оформляются и не закрываются, так что открыты все
+    open_carts: int
+    carts_value: float
@@ -0,0 +1,471 @@
+import sqlite3
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from fast_json import FragmentCache
+from repository import (
+    CART_ORDER_ID,
+    CART_ORDER_PRICE,
+    CART_ORDER_QUANTITY,
+    NotFoundError,
+    Repository,
+)
+from schemas import ItemCreate, ItemPatch, Item, CartItem, Cart, Stats
+from stats import PRICE_BUCKETS, price_histogram
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    -- name.casefold() для поиска без учёта регистра
+    name_folded TEXT NOT NULL,
+    price REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_deleted_price ON items (deleted, price, id);
+CREATE INDEX IF NOT EXISTS items_price ON items (price, id);
+CREATE INDEX IF NOT EXISTS items_name_folded ON items (name_folded);
+
+CREATE TABLE IF NOT EXISTS carts (
+    id INTEGER PRIMARY KEY,
+    price REAL NOT NULL DEFAULT 0,
+    total_quantity INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS carts_price ON carts (price, id);
+CREATE INDEX IF NOT EXISTS carts_quantity ON carts (total_quantity, id);
+
+-- rowid сохраняет порядок добавления позиций в корзину
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id INTEGER NOT NULL REFERENCES carts (id),
+    item_id INTEGER NOT NULL REFERENCES items (id),
+    quantity INTEGER NOT NULL,
+    UNIQUE (cart_id, item_id)
+);
+CREATE INDEX IF NOT EXISTS cart_items_item ON cart_items (item_id);
+"""
+
+
+def _price_bucket_sql(price: str) -> str:
+    """SQL for stats.price_bucket: the number of bucket bounds below price."""
+    return " + ".join(f"({price} > {bound!r})" for bound in PRICE_BUCKETS)
+
+
+# Итоги для GET /stats: начальные значения считаются один раз по уже лежащим
+# данным, дальше их двигают триггеры, в том числе внутри SHIFT_CART_PRICES
+STATS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    live_items INTEGER NOT NULL,
+    deleted_items INTEGER NOT NULL,
+    carts INTEGER NOT NULL,
+    carts_value REAL NOT NULL
+);
+INSERT OR IGNORE INTO stats
+SELECT 0,
+    (SELECT count(*) FROM items WHERE deleted = 0),
+    (SELECT count(*) FROM items WHERE deleted != 0),
+    (SELECT count(*) FROM carts),
+    (SELECT coalesce(sum(price), 0) FROM carts);
+
+CREATE TABLE IF NOT EXISTS price_histogram (
+    bucket INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO price_histogram
+SELECT value, (SELECT count(*) FROM items WHERE deleted = 0 AND {_price_bucket_sql("price")} = value)
+FROM json_each('{list(range(len(PRICE_BUCKETS) + 1))}');
+
+CREATE TRIGGER IF NOT EXISTS items_stats_insert AFTER INSERT ON items BEGIN
+    UPDATE stats SET
+        live_items = live_items + (NEW.deleted = 0),
+        deleted_items = deleted_items + (NEW.deleted != 0);
+    UPDATE price_histogram SET count = count + 1
+    WHERE NEW.deleted = 0 AND bucket = {_price_bucket_sql("NEW.price")};
+END;
+CREATE TRIGGER IF NOT EXISTS items_stats_update AFTER UPDATE OF price, deleted ON items BEGIN
+    UPDATE stats SET
+        live_items = live_items - (OLD.deleted = 0) + (NEW.deleted = 0),
+        deleted_items = deleted_items - (OLD.deleted != 0) + (NEW.deleted != 0);
+    UPDATE price_histogram SET count = count - 1
+    WHERE OLD.deleted = 0 AND bucket = {_price_bucket_sql("OLD.price")};
+    UPDATE price_histogram SET count = count + 1
+    WHERE NEW.deleted = 0 AND bucket = {_price_bucket_sql("NEW.price")};
+END;
+CREATE TRIGGER IF NOT EXISTS carts_stats_insert AFTER INSERT ON carts BEGIN
+    UPDATE stats SET carts = carts + 1, carts_value = carts_value + NEW.price;
+END;
+CREATE TRIGGER IF NOT EXISTS carts_stats_update AFTER UPDATE OF price ON carts BEGIN
+    UPDATE stats SET carts_value = carts_value + NEW.price - OLD.price;
+END;
+"""
+
+# Колонка и ключ сортировки для каждого порядка выдачи корзин
+CART_ORDER_COLUMNS = {
+    CART_ORDER_ID: "id",
+    CART_ORDER_PRICE: "price",
+    CART_ORDER_QUANTITY: "total_quantity",
+}
+
+SELECT_ITEM = "SELECT id, name, price, deleted FROM items WHERE id = ?"
+INSERT_ITEM = "INSERT INTO items (id, name, name_folded, price, deleted) VALUES (?, ?, ?, ?, ?)"
+EXPORT_PAGE_SIZE = 1000
+SELECT_CART = "SELECT id, price FROM carts WHERE id = ?"
+SELECT_CART_LINES = """
+SELECT ci.cart_id, ci.item_id, i.name, ci.quantity, i.deleted
+FROM cart_items AS ci JOIN items AS i ON i.id = ci.item_id
+WHERE ci.cart_id IN (SELECT value FROM json_each(?))
+ORDER BY ci.rowid
+"""
+UPSERT_CART_LINE = """
+INSERT INTO cart_items (cart_id, item_id, quantity) VALUES (?, ?, ?)
+ON CONFLICT (cart_id, item_id) DO UPDATE SET quantity = quantity + excluded.quantity
+"""
+# Cart.price учитывает только доступные позиции, сдвигаем его на разницу цен
+SHIFT_CART_PRICES = """
+UPDATE carts SET price = carts.price + ? * ci.quantity
+FROM cart_items AS ci WHERE ci.cart_id = carts.id AND ci.item_id = ?
+"""
+
+
+class SqliteStore(Repository):
+    """Items and carts in a SQLite database, shared by a pool of connections.
+
+    The database runs in WAL mode, so readers don't block the single writer;
+    writes use BEGIN IMMEDIATE to take the write lock up front. Queries are
+    constant strings, so each connection prepares them once and reuses them
+    from its statement cache.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, pool_size: int = 8):
+        super().__init__()
+        # модели собираются заново при каждом чтении, кэшировать нечего
+        self.item_json = FragmentCache(keep=False)
+        self.cart_json = FragmentCache(keep=False)
+        self._path = path
+        self._pool: LifoQueue = LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as connection:
+            # одна транзакция: итоги не разойдутся с данными, даже если
+            # схему одновременно создаёт другой процесс
+            connection.executescript("BEGIN IMMEDIATE;" + SCHEMA + STATS_SCHEMA + "COMMIT;")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self._path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA busy_timeout = 5000")
+        return connection
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            connection = self._pool.get_nowait()
+        except Empty:
+            connection = self._connect()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    @contextmanager
+    def _transaction(self, write: bool = False) -> Iterator[sqlite3.Connection]:
+        with self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                return
+
+    # Товары
+
+    def create_item(self, item_data: ItemCreate) -> Item:
+        with self._transaction(write=True) as connection:
+            cursor = connection.execute(
+                "INSERT INTO items (name, name_folded, price, deleted) VALUES (?, ?, ?, ?)",
+                (item_data.name, item_data.name.casefold(), item_data.price, item_data.deleted),
+            )
+        return Item.from_item(item_data, cursor.lastrowid)
+
+    def create_items(self, items_data: List[ItemCreate]) -> List[Item]:
+        with self._transaction(write=True) as connection:
+            (last_id,) = connection.execute("SELECT coalesce(max(id), 0) FROM items").fetchone()
+            connection.executemany(
+                INSERT_ITEM,
+                [
+                    (
+                        last_id + 1 + i,
+                        item_data.name,
+                        item_data.name.casefold(),
+                        item_data.price,
+                        item_data.deleted,
+                    )
+                    for i, item_data in enumerate(items_data)
+                ],
+            )
+        return [
+            Item.from_item(item_data, last_id + 1 + i) for i, item_data in enumerate(items_data)
+        ]
+
+    def iter_items(self) -> Iterator[Item]:
+        # страницы по ключу, чтобы не держать соединение и не читать таблицу целиком
+        last_id = 0
+        while True:
+            with self._connection() as connection:
+                rows = connection.execute(
+                    "SELECT id, name, price, deleted FROM items WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, EXPORT_PAGE_SIZE),
+                ).fetchall()
+            yield from map(_item_from_row, rows)
+            if len(rows) < EXPORT_PAGE_SIZE:
+                return
+            last_id = rows[-1][0]
+
+    def get_item(self, id: int) -> Optional[Item]:
+        with self._connection() as connection:
+            item = _fetch_item(connection, id)
+        if not item or item.deleted:
+            return None
+        return item
+
+    def list_items(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        show_deleted: bool = False,
+        after: Optional[Tuple[float, int]] = None,
+        name_contains: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+    ) -> List[Item]:
+        conditions = [] if show_deleted else ["deleted = 0"]
+        params: list = []
+        if name_contains:
+            conditions.append("instr(name_folded, ?) > 0")
+            params.append(name_contains.casefold())
+        if name_prefix:
+            # диапазон по индексу: U+10FFFF больше любого символа в UTF-8
+            prefix = name_prefix.casefold()
+            conditions.append("name_folded >= ? AND name_folded < ?")
+            params.extend((prefix, prefix + "\U0010ffff"))
+        if min_price is not None:
+            conditions.append("price >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append("price <= ?")
+            params.append(max_price)
+        if after is not None:
+            conditions.append("(price, id) > (?, ?)")
+            params.extend(after)
+        query = (
+            "SELECT id, name, price, deleted FROM items"
+            + _where(conditions)
+            + " ORDER BY price, id LIMIT ? OFFSET ?"
+        )
+        with self._connection() as connection:
+            rows = connection.execute(query, (*params, limit, offset)).fetchall()
+        # строки до OFFSET SQLite тоже проходит, это нижняя граница прочитанного
+        metrics.observe_scan("list_items", offset + len(rows))
+        return [_item_from_row(row) for row in rows]
+
+    def update_item(self, id: int, item_data: ItemCreate) -> Optional[Item]:
+        with self._transaction(write=True) as connection:
+            item = _fetch_item(connection, id)
+            if not item or item.deleted:
+                return None
+            return _replace_item(connection, item, Item.from_item(item_data, id))
+
+    def patch_item(self, id: int, item_data: ItemPatch) -> Optional[Item]:
+        with self._transaction(write=True) as connection:
+            item = _fetch_item(connection, id)
+            if not item or item.deleted:
+                return None
+            updated_item = item.model_copy(update=item_data.model_dump(exclude_none=True))
+            return _replace_item(connection, item, updated_item)
+
+    def delete_item(self, id: int) -> Optional[Item]:
+        with self._transaction(write=True) as connection:
+            item = _fetch_item(connection, id)
+            if not item:
+                return None
+            if not item.deleted:
+                return _replace_item(connection, item, item.model_copy(update={"deleted": True}))
+            return item
+
+    # Корзины
+
+    def create_cart(self) -> Cart:
+        with self._transaction(write=True) as connection:
+            cursor = connection.execute("INSERT INTO carts DEFAULT VALUES")
+        return Cart(id=cursor.lastrowid, items=[])
+
+    def get_cart(self, id: int) -> Optional[Cart]:
+        with self._transaction() as connection:
+            row = connection.execute(SELECT_CART, (id,)).fetchone()
+            if row is None:
+                return None
+            return _load_carts(connection, [row])[0]
+
+    def list_carts(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_quantity: Optional[int] = None,
+        max_quantity: Optional[int] = None,
+        after: Optional[Tuple[int, float, int]] = None,
+    ) -> Tuple[int, List[Tuple[float, Cart]]]:
+        conditions = []
+        params: list = []
+        for column, operator, value in (
+            ("price", ">=", min_price),
+            ("price", "<=", max_price),
+            ("total_quantity", ">=", min_quantity),
+            ("total_quantity", "<=", max_quantity),
+        ):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+
+        # Планировщик сам выберет индекс, порядок фиксируем для курсора
+        if min_price is not None or max_price is not None:
+            order = CART_ORDER_PRICE
+        elif min_quantity is not None or max_quantity is not None:
+            order = CART_ORDER_QUANTITY
+        else:
+            order = CART_ORDER_ID
+        column = CART_ORDER_COLUMNS[order]
+
+        if after is not None:
+            after_order, key, after_id = after
+            if after_order != order:
+                raise ValueError("Cursor was issued for another order")
+            conditions.append(f"({column}, id) > (?, ?)")
+            params.extend((key, after_id))
+
+        query = (
+            f"SELECT id, price, {column} FROM carts"
+            + _where(conditions)
+            + f" ORDER BY {column}, id LIMIT ? OFFSET ?"
+        )
+        with self._transaction() as connection:
+            rows = connection.execute(query, (*params, limit, offset)).fetchall()
+            carts = _load_carts(connection, [(cart_id, price) for cart_id, price, _ in rows])
+        metrics.observe_scan("list_carts", offset + len(rows))
+        return order, [(row[2], cart) for row, cart in zip(rows, carts)]
+
+    def add_to_cart(self, cart_id: int, lines: List[Tuple[int, int]]) -> Cart:
+        with self._transaction(write=True) as connection:
+            row = connection.execute(SELECT_CART, (cart_id,)).fetchone()
+            if row is None:
+                raise NotFoundError("Cart not found")
+
+            # сначала проверяем все товары, чтобы не применить запрос наполовину
+            resolved = []
+            for item_id, quantity in lines:
+                item = _fetch_item(connection, item_id)
+                if not item or item.deleted:
+                    raise NotFoundError("Item not found")
+                resolved.append((item, quantity))
+
+            price = 0.0
+            total_quantity = 0
+            for item, quantity in resolved:
+                connection.execute(UPSERT_CART_LINE, (cart_id, item.id, quantity))
+                price += item.price * quantity
+                total_quantity += quantity
+            connection.execute(
+                "UPDATE carts SET price = price + ?, total_quantity = total_quantity + ? "
+                "WHERE id = ?",
+                (price, total_quantity, cart_id),
+            )
+            row = connection.execute(SELECT_CART, (cart_id,)).fetchone()
+            cart = _load_carts(connection, [row])[0]
+        # по позиции на строку запроса и все позиции корзины, перечитанные для ответа
+        metrics.observe_cart_lines(len(resolved) + len(cart.items))
+        return cart
+
+    def get_stats(self) -> Stats:
+        with self._transaction() as connection:
+            live_items, deleted_items, carts, carts_value = connection.execute(
+                "SELECT live_items, deleted_items, carts, carts_value FROM stats"
+            ).fetchone()
+            counts = [
+                count
+                for (count,) in connection.execute(
+                    "SELECT count FROM price_histogram ORDER BY bucket"
+                )
+            ]
+        return Stats(
+            live_items=live_items,
+            deleted_items=deleted_items,
+            price_histogram=price_histogram(counts),
+            open_carts=carts,
+            carts_value=carts_value,
+        )
+
+
+def _where(conditions: List[str]) -> str:
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _item_from_row(row: tuple) -> Item:
+    id, name, price, deleted = row
+    return Item(id=id, name=name, price=price, deleted=bool(deleted))
+
+
+def _fetch_item(connection: sqlite3.Connection, id: int) -> Optional[Item]:
+    row = connection.execute(SELECT_ITEM, (id,)).fetchone()
+    return None if row is None else _item_from_row(row)
+
+
+def _replace_item(connection: sqlite3.Connection, item: Item, updated_item: Item) -> Item:
+    connection.execute(
+        "UPDATE items SET name = ?, name_folded = ?, price = ?, deleted = ? WHERE id = ?",
+        (
+            updated_item.name,
+            updated_item.name.casefold(),
+            updated_item.price,
+            updated_item.deleted,
+            updated_item.id,
+        ),
+    )
+    # Имя и доступность позиций берутся из items при чтении, пересчитываем только цену
+    old_price = 0.0 if item.deleted else item.price
+    new_price = 0.0 if updated_item.deleted else updated_item.price
+    if new_price != old_price:
+        connection.execute(SHIFT_CART_PRICES, (new_price - old_price, item.id))
+    return updated_item
+
+
+def _load_carts(connection: sqlite3.Connection, rows: List[tuple]) -> List[Cart]:
+    lines: Dict[int, List[CartItem]] = {cart_id: [] for cart_id, _ in rows}
+    if rows:
+        cart_ids = "[" + ",".join(str(cart_id) for cart_id, _ in rows) + "]"
+        for cart_id, item_id, name, quantity, deleted in connection.execute(
+            SELECT_CART_LINES, (cart_ids,)
+        ):
+            lines[cart_id].append(
+                CartItem(id=item_id, name=name, quantity=quantity, available=not deleted)
+            )
+    return [Cart(id=cart_id, items=lines[cart_id], price=price) for cart_id, price in rows]
@@ -0,0 +1,76 @@
+from bisect import bisect_left
+from threading import Lock
+from typing import List, Optional
+
+from schemas import Item, PriceBucket, Stats
+
+# Верхние границы корзин гистограммы цен, последняя корзина — всё, что дороже
+PRICE_BUCKETS = (10.0, 100.0, 1000.0, 10000.0)
+
+
+def price_bucket(price: float) -> int:
+    return bisect_left(PRICE_BUCKETS, price)
+
+
+def price_histogram(counts: List[int]) -> List[PriceBucket]:
+    return [
+        PriceBucket(le=le, count=count) for le, count in zip((*PRICE_BUCKETS, None), counts)
+    ]
+
+
+class CatalogStats:
+    """Running totals behind GET /stats.
+
+    Every mutation moves a few counters by its own delta, so reading the
+    stats never scans items or carts. Only live items are counted in the
+    price histogram.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._live_items = 0
+        self._deleted_items = 0
+        self._price_counts = [0] * (len(PRICE_BUCKETS) + 1)
+        self._carts = 0
+        self._carts_value = 0.0
+
+    def item_changed(self, old_item: Optional[Item], new_item: Item) -> None:
+        """Account for a new item (old_item is None) or a replaced one."""
+        with self._lock:
+            if old_item is not None:
+                self._count_item(old_item, -1)
+            self._count_item(new_item, 1)
+
+    def load(self, items: List[Item], cart_prices: List[float]) -> None:
+        """Count a bulk-loaded state, taking the lock once instead of per entity."""
+        with self._lock:
+            for item in items:
+                self._count_item(item, 1)
+            self._carts += len(cart_prices)
+            self._carts_value += sum(cart_prices)
+
+    def cart_added(self, price: float = 0.0) -> None:
+        with self._lock:
+            self._carts += 1
+            self._carts_value += price
+
+    def cart_value_changed(self, delta: float) -> None:
+        with self._lock:
+            self._carts_value += delta
+
+    def snapshot(self) -> Stats:
+        with self._lock:
+            return Stats(
+                live_items=self._live_items,
+                deleted_items=self._deleted_items,
+                price_histogram=price_histogram(self._price_counts),
+                open_carts=self._carts,
+                carts_value=self._carts_value,
+            )
+
+    def _count_item(self, item: Item, sign: int) -> None:
+        if item.deleted:
+            self._deleted_items += sign
+        else:
+            self._live_items += sign
+            self._price_counts[price_bucket(item.price)] += sign
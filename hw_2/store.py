@@ -0,0 +1,506 @@
+from contextlib import contextmanager
+from heapq import merge, nsmallest
+from itertools import islice
+from threading import Condition, Lock
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import metrics
+from indexes import SortedIndex, TrigramIndex
+from repository import (
+    CART_ORDER_ID,
+    CART_ORDER_PRICE,
+    CART_ORDER_QUANTITY,
+    NotFoundError,
+    Repository,
+)
+from schemas import ItemCreate, ItemPatch, Item, CartItem, Cart, Stats
+from stats import CatalogStats
+from wal import WriteAheadLog, encode_cart, encode_cart_add, encode_item
+
+
+class IdSequence:
+    """Monotonic id allocator, safe to call from several threads."""
+
+    def __init__(self, start: int = 1):
+        self._next = start
+        self._lock = Lock()
+
+    def next(self, count: int = 1) -> int:
+        """Allocate ``count`` consecutive ids and return the first one."""
+        with self._lock:
+            value = self._next
+            self._next += count
+            return value
+
+    @property
+    def last(self) -> int:
+        """Largest id handed out so far."""
+        return self._next - 1
+
+    def advance(self, value: int) -> None:
+        """Make sure ids up to value are never handed out again."""
+        with self._lock:
+            self._next = max(self._next, value + 1)
+
+
+class RWLock:
+    """Any number of readers or a single writer; waiting writers go first."""
+
+    def __init__(self):
+        self._condition = Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class Store(Repository):
+    """In-memory items and carts with their secondary indexes.
+
+    Locking, always taken in this order:
+
+    * ``_items_lock`` — item writes take it exclusively, adding to carts and
+      listing items take it shared, so an item cannot change while a cart
+      line is priced from it;
+    * one lock per cart for its lines, price and total quantity;
+    * ``_cart_index_lock`` and ``_item_carts_lock`` for the shared cart
+      indexes, held only for the index update itself.
+
+    With a write-ahead log attached, each mutation appends its record while
+    still holding these locks, so the log order matches the order the
+    mutations were applied in, and waits for the fsync after releasing them.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.items: Dict[int, Item] = {}
+        self.carts: Dict[int, Cart] = {}
+
+        # Вторичные индексы товаров по цене, удалённые товары хранятся отдельно
+        self.items_by_price = SortedIndex()
+        self.deleted_items_by_price = SortedIndex()
+        # Триграммный индекс имён для поиска по подстроке и префиксу
+        self.item_names = TrigramIndex()
+        # Индексы корзин по цене и общему количеству товаров
+        self.carts_by_price = SortedIndex()
+        self.carts_by_quantity = SortedIndex()
+        # Обратный индекс: id товара -> id корзин, в которых он лежит
+        self.item_carts: Dict[int, Set[int]] = {}
+        # Итоги для GET /stats, двигаются каждым изменением
+        self.stats = CatalogStats()
+
+        self._item_ids = IdSequence()
+        self._cart_ids = IdSequence()
+        self._items_lock = RWLock()
+        self._cart_locks: Dict[int, Lock] = {}
+        self._cart_index_lock = Lock()
+        self._item_carts_lock = Lock()
+        self._wal: Optional[WriteAheadLog] = None
+
+    # Товары
+
+    def create_item(self, item_data: ItemCreate) -> Item:
+        new_item = Item.from_item(item_data, self._item_ids.next())
+        with self._items_lock.write():
+            self._insert_item(new_item)
+            seq = self._log(encode_item, new_item)
+        self._sync(seq)
+        return new_item
+
+    def create_items(self, items_data: List[ItemCreate]) -> List[Item]:
+        first_id = self._item_ids.next(len(items_data))
+        new_items = [
+            Item.from_item(item_data, first_id + i) for i, item_data in enumerate(items_data)
+        ]
+        with self._items_lock.write():
+            self._insert_items(new_items)
+            seq = 0
+            for item in new_items:
+                seq = self._log(encode_item, item)
+        self._sync(seq)
+        return new_items
+
+    def iter_items(self) -> Iterator[Item]:
+        # идём по диапазону id, а не по словарю: его можно менять во время выгрузки
+        for item_id in range(1, self._item_ids.last + 1):
+            item = self.items.get(item_id)
+            if item is not None:
+                yield item
+
+    def get_item(self, id: int) -> Optional[Item]:
+        item = self.items.get(id)
+        if not item or item.deleted:
+            return None
+        return item
+
+    def list_items(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        show_deleted: bool = False,
+        after: Optional[Tuple[float, int]] = None,
+        name_contains: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+    ) -> List[Item]:
+        with self._items_lock.read():
+            if name_contains or name_prefix:
+                item_ids = self.item_names.search(name_contains, name_prefix)
+                page = self._search_items(
+                    offset + limit, min_price, max_price, show_deleted, after, item_ids
+                )
+                metrics.observe_scan("list_items", len(item_ids))
+                return [self.items[item_id] for _, item_id in page[offset:]]
+
+            stop = offset + limit
+            start, end = self.items_by_price.bounds(min_price, max_price)
+            if after is not None:
+                start = max(start, self.items_by_price.position_after(*after))
+            if not show_deleted:
+                page = self.items_by_price.entries(start + offset, min(end, start + stop))
+                metrics.observe_scan("list_items", len(page))
+                return [self.items[item_id] for _, item_id in page]
+
+            deleted_start, deleted_end = self.deleted_items_by_price.bounds(min_price, max_price)
+            if after is not None:
+                deleted_start = max(
+                    deleted_start, self.deleted_items_by_price.position_after(*after)
+                )
+            # обе половины упорядочены по (price, id), сливаем только нужный префикс
+            live = self.items_by_price.entries(start, min(end, start + stop))
+            deleted = self.deleted_items_by_price.entries(
+                deleted_start, min(deleted_end, deleted_start + stop)
+            )
+            metrics.observe_scan("list_items", len(live) + len(deleted))
+            page = islice(merge(live, deleted), offset, stop)
+            return [self.items[item_id] for _, item_id in page]
+
+    def _search_items(
+        self,
+        count: int,
+        min_price: Optional[float],
+        max_price: Optional[float],
+        show_deleted: bool,
+        after: Optional[Tuple[float, int]],
+        item_ids: Set[int],
+    ) -> List[Tuple[float, int]]:
+        """First ``count`` (price, id) entries among item_ids passing the filters.
+
+        Prices come from the price indexes, so only the returned page is
+        read from ``items``.
+        """
+        entries = []
+        for item_id in item_ids:
+            price = self.items_by_price.key(item_id)
+            if price is None and show_deleted:
+                price = self.deleted_items_by_price.key(item_id)
+            if (
+                price is None
+                or (min_price is not None and price < min_price)
+                or (max_price is not None and price > max_price)
+                or (after is not None and (price, item_id) <= after)
+            ):
+                continue
+            entries.append((price, item_id))
+        return nsmallest(count, entries)
+
+    def update_item(self, id: int, item_data: ItemCreate) -> Optional[Item]:
+        with self._items_lock.write():
+            item = self.items.get(id)
+            if not item or item.deleted:
+                return None
+            updated_item = self._replace_item(item, Item.from_item(item_data, id))
+            seq = self._log(encode_item, updated_item)
+        self._sync(seq)
+        return updated_item
+
+    def patch_item(self, id: int, item_data: ItemPatch) -> Optional[Item]:
+        with self._items_lock.write():
+            item = self.items.get(id)
+            if not item or item.deleted:
+                return None
+            updated_item = item.model_copy(update=item_data.model_dump(exclude_none=True))
+            self._replace_item(item, updated_item)
+            seq = self._log(encode_item, updated_item)
+        self._sync(seq)
+        return updated_item
+
+    def delete_item(self, id: int) -> Optional[Item]:
+        with self._items_lock.write():
+            item = self.items.get(id)
+            if not item:
+                return None
+            if item.deleted:
+                return item
+            # новый объект, а не item.deleted = True: записи товаров не меняются на месте
+            deleted_item = self._replace_item(item, item.model_copy(update={"deleted": True}))
+            seq = self._log(encode_item, deleted_item)
+        self._sync(seq)
+        return deleted_item
+
+    def _insert_item(self, item: Item) -> None:
+        self.items[item.id] = item
+        self._index_item(item)
+        self.stats.item_changed(None, item)
+
+    def _insert_items(self, items: List[Item]) -> None:
+        for item in items:
+            self.items[item.id] = item
+            self.item_names.add(item.id, item.name)
+            self.stats.item_changed(None, item)
+        self.items_by_price.add_many({item.id: item.price for item in items if not item.deleted})
+        self.deleted_items_by_price.add_many(
+            {item.id: item.price for item in items if item.deleted}
+        )
+
+    def _replace_item(self, item: Item, updated_item: Item) -> Item:
+        self.items[updated_item.id] = updated_item
+        self._index_item(updated_item)
+        self.stats.item_changed(item, updated_item)
+        self._propagate_item_change(item, updated_item)
+        return updated_item
+
+    def _index_item(self, item: Item) -> None:
+        self.items_by_price.remove(item.id)
+        self.deleted_items_by_price.remove(item.id)
+        index = self.deleted_items_by_price if item.deleted else self.items_by_price
+        index.add(item.id, item.price)
+        self.item_names.add(item.id, item.name)
+
+    def _propagate_item_change(self, old_item: Item, new_item: Item) -> None:
+        """Update the lines of new_item in every cart holding it.
+
+        Cart.price only counts available lines, so it moves by the change in
+        the item's effective price (0 once deleted) times the line quantity.
+        """
+        old_price = 0.0 if old_item.deleted else old_item.price
+        new_price = 0.0 if new_item.deleted else new_item.price
+        if (old_price, old_item.name, old_item.deleted) == (
+            new_price,
+            new_item.name,
+            new_item.deleted,
+        ):
+            return
+
+        with self._item_carts_lock:
+            cart_ids = sorted(self.item_carts.get(new_item.id, ()))
+        for cart_id in cart_ids:
+            cart = self.carts[cart_id]
+            with self._cart_locks[cart_id]:
+                cart_item = cart.get_line(new_item.id)
+                if new_price != old_price:
+                    self._cart_changing(cart)
+                cart_item.name = new_item.name
+                cart_item.available = not new_item.deleted
+                if new_price != old_price:
+                    delta = (new_price - old_price) * cart_item.quantity
+                    cart.price += delta
+                    self.stats.cart_value_changed(delta)
+                    self._index_cart(cart)
+                self.cart_json.invalidate(cart_id)
+
+    # Корзины
+
+    def create_cart(self) -> Cart:
+        new_cart = Cart(id=self._cart_ids.next(), items=[])
+        with self._items_lock.read():
+            self._insert_cart(new_cart)
+            seq = self._log(encode_cart, new_cart.id)
+        self._sync(seq)
+        return new_cart
+
+    def _insert_cart(self, cart: Cart) -> None:
+        self._cart_locks[cart.id] = Lock()
+        self.carts[cart.id] = cart
+        self._index_cart(cart)
+        self.stats.cart_added(cart.price)
+
+    def get_cart(self, id: int) -> Optional[Cart]:
+        return self.carts.get(id)
+
+    def list_carts(
+        self,
+        offset: int,
+        limit: int,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_quantity: Optional[int] = None,
+        max_quantity: Optional[int] = None,
+        after: Optional[Tuple[int, float, int]] = None,
+    ) -> Tuple[int, List[Tuple[float, Cart]]]:
+        by_price = min_price is not None or max_price is not None
+        by_quantity = min_quantity is not None or max_quantity is not None
+
+        with self._cart_index_lock:
+            price_bounds = self.carts_by_price.bounds(min_price, max_price)
+            quantity_bounds = self.carts_by_quantity.bounds(min_quantity, max_quantity)
+
+            # Идём по индексу с самым узким диапазоном, второй фильтр проверяем на лету.
+            # Следующие страницы идут в порядке курсора: ширины диапазонов могли
+            # измениться, а при двух фильтрах подходит любой из двух индексов
+            if by_price and by_quantity and after is not None and after[0] != CART_ORDER_ID:
+                by_price_index = after[0] == CART_ORDER_PRICE
+            else:
+                by_price_index = by_price and (
+                    not by_quantity
+                    or price_bounds[1] - price_bounds[0] <= quantity_bounds[1] - quantity_bounds[0]
+                )
+            if by_price_index:
+                order, index, (start, end) = CART_ORDER_PRICE, self.carts_by_price, price_bounds
+            elif by_quantity:
+                order, index, (start, end) = (
+                    CART_ORDER_QUANTITY,
+                    self.carts_by_quantity,
+                    quantity_bounds,
+                )
+            else:
+                order, index, (start, end) = CART_ORDER_ID, None, (0, len(self.carts))
+
+            if after is not None:
+                after_order, *position = after
+                if after_order != order:
+                    raise ValueError("Cursor was issued for another order")
+                start = max(
+                    start,
+                    int(position[1]) if index is None else index.position_after(*position),
+                )
+
+            if by_price and by_quantity:
+                matched = []
+                scanned = 0
+                for key, cart in self._iter_cart_entries(index, start, end):
+                    scanned += 1
+                    if _cart_matches(cart, min_price, max_price, min_quantity, max_quantity):
+                        matched.append((key, cart))
+                        if len(matched) == offset + limit:
+                            break
+                page = matched[offset:]
+            else:
+                page = list(
+                    self._iter_cart_entries(
+                        index, start + offset, min(end, start + offset + limit)
+                    )
+                )
+                scanned = len(page)
+
+        metrics.observe_scan("list_carts", scanned)
+        return order, page
+
+    def add_to_cart(self, cart_id: int, lines: List[Tuple[int, int]]) -> Cart:
+        # сначала проверяем все товары, чтобы не применить запрос наполовину
+        cart = self.carts.get(cart_id)
+        if not cart:
+            raise NotFoundError("Cart not found")
+
+        with self._items_lock.read():
+            resolved = []
+            for item_id, quantity in lines:
+                item = self.items.get(item_id)
+                if not item or item.deleted:
+                    raise NotFoundError("Item not found")
+                resolved.append((item, quantity))
+
+            with self._cart_locks[cart_id]:
+                self._cart_changing(cart)
+                price = 0.0
+                total_quantity = 0
+                for item, quantity in resolved:
+                    cart_item = cart.get_line(item.id)
+                    if cart_item is None:
+                        cart.add_line(
+                            CartItem(id=item.id, name=item.name, quantity=quantity, available=True)
+                        )
+                        with self._item_carts_lock:
+                            self.item_carts.setdefault(item.id, set()).add(cart.id)
+                    else:
+                        cart_item.quantity += quantity
+                    price += item.price * quantity
+                    total_quantity += quantity
+
+                cart.price += price
+                self.stats.cart_value_changed(price)
+                cart.total_quantity += total_quantity
+                self._index_cart(cart)
+                self.cart_json.invalidate(cart_id)
+                seq = self._log(encode_cart_add, cart_id, lines)
+        # позиции ищутся по id товара, каждая строка запроса читает одну позицию
+        metrics.observe_cart_lines(len(resolved))
+        self._sync(seq)
+        return cart
+
+    def get_stats(self) -> Stats:
+        return self.stats.snapshot()
+
+    # Журнал
+
+    def _log(self, encode, *args) -> int:
+        return 0 if self._wal is None else self._wal.append(encode(*args))
+
+    def _sync(self, seq: int) -> None:
+        if seq:
+            self._wal.sync(seq)
+
+    def _cart_changing(self, cart: Cart) -> None:
+        """Called under the cart lock right before its lines or price change."""
+
+    def _index_cart(self, cart: Cart) -> None:
+        with self._cart_index_lock:
+            self.carts_by_price.add(cart.id, cart.price)
+            self.carts_by_quantity.add(cart.id, cart.total_quantity)
+
+    def _iter_cart_entries(
+        self, index: Optional[SortedIndex], start: int, end: int
+    ) -> Iterator[Tuple[float, Cart]]:
+        if index is None:
+            # id корзин выдаются подряд: на позиции i лежит корзина с id i + 1
+            for cart_id in range(start + 1, end + 1):
+                cart = self.carts.get(cart_id)
+                if cart is not None:
+                    yield cart_id, cart
+        else:
+            for key, cart_id in index.iter_entries(start, end):
+                yield key, self.carts[cart_id]
+
+
+def _cart_matches(
+    cart: Cart,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    min_quantity: Optional[int],
+    max_quantity: Optional[int],
+) -> bool:
+    return not (
+        (min_price is not None and cart.price < min_price) or
+        (max_price is not None and cart.price > max_price) or
+        (min_quantity is not None and cart.total_quantity < min_quantity) or
+        (max_quantity is not None and cart.total_quantity > max_quantity)
+    )
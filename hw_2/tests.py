@@ -1,3 +1,6 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 from typing import Any
 from uuid import uuid4
@@ -6,7 +9,18 @@ import pytest
 from faker import Faker
 from fastapi.testclient import TestClient
 
+import columnar
+import durable_store
+import fast_json
+import main
+from durable_store import DurableStore
+from indexes import TrigramIndex
 from main import app
+from pagination import encode_cursor
+from repository import CART_ORDER_QUANTITY
+from schemas import Item, ItemCreate, ItemPatch
+from store import Store
+from wal import WriteAheadLog, read_log
 
 client = TestClient(app)
 faker = Faker()
@@ -96,6 +110,44 @@ def test_get_cart(request, cart_fixture: int, should_be_filled: bool) -> None:
     else:
         assert response_json["price"] == 0.0
 
+def test_add_items_to_cart(empty_cart_id: int, item_ids: list[int]) -> None:
+    lines = [
+        {"id": item_ids[0], "quantity": 3},
+        {"id": item_ids[1]},
+        {"id": item_ids[0], "quantity": 2},
+    ]
+    response = client.post(f"/cart/{empty_cart_id}/add", json=lines)
+    assert response.status_code == HTTPStatus.OK
+
+    cart = response.json()
+    assert [(item["id"], item["quantity"]) for item in cart["items"]] == [
+        (item_ids[0], 5),
+        (item_ids[1], 1),
+    ]
+    prices = {item_id: client.get(f"/item/{item_id}").json()["price"] for item_id in item_ids[:2]}
+    assert cart["price"] == pytest.approx(prices[item_ids[0]] * 5 + prices[item_ids[1]], 1e-8)
+
+    response = client.post(f"/cart/{empty_cart_id}/add/{item_ids[1]}")
+    assert [(item["id"], item["quantity"]) for item in response.json()["items"]] == [
+        (item_ids[0], 5),
+        (item_ids[1], 2),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("lines", "expected_status"),
+    [
+        ([{"id": 10_000_000}], HTTPStatus.NOT_FOUND),
+        ([{"id": 1, "quantity": 0}], HTTPStatus.UNPROCESSABLE_ENTITY),
+        ([{"id": 1, "odd": "value"}], HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+def test_add_items_to_cart_invalid(empty_cart_id: int, lines: list, expected_status: int) -> None:
+    response = client.post(f"/cart/{empty_cart_id}/add", json=lines)
+    assert response.status_code == expected_status
+    assert client.get(f"/cart/{empty_cart_id}").json()["items"] == []
+
+
 @pytest.mark.parametrize(
     ("params", "expected_status"),
     [
@@ -131,6 +183,55 @@ def test_get_cart_list(params: dict[str, Any], expected_status: int):
             assert sum(item["quantity"] for cart in data for item in cart["items"]) <= params["max_quantity"]
 
 
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"min_quantity": 2, "max_quantity": 5},
+        {"min_price": 50.0, "max_price": 500.0},
+        {"min_quantity": 1, "max_price": 1000.0, "offset": 1, "limit": 3},
+    ],
+)
+def test_get_cart_list_filter_then_paginate(params: dict[str, Any]) -> None:
+    filters = {key: value for key, value in params.items() if key not in ("offset", "limit")}
+    all_carts = client.get("/cart", params={"limit": 10_000}).json()
+    expected = [
+        cart for cart in all_carts
+        if filters.get("min_price", 0) <= cart["price"] <= filters.get("max_price", float("inf"))
+        and filters.get("min_quantity", 0)
+        <= sum(item["quantity"] for item in cart["items"])
+        <= filters.get("max_quantity", float("inf"))
+    ]
+
+    matching = client.get("/cart", params={**filters, "limit": 10_000}).json()
+    assert sorted(cart["id"] for cart in matching) == sorted(cart["id"] for cart in expected)
+
+    offset, limit = params.get("offset", 0), params.get("limit", 10)
+    page = client.get("/cart", params=params).json()
+    assert page == matching[offset : offset + limit]
+
+
+def test_item_changes_propagate_to_carts(empty_cart_id: int, item_ids: list[int]) -> None:
+    item = client.post("/item", json={"name": "товар", "price": 10.0}).json()
+    client.post(f"/cart/{empty_cart_id}/add", json=[{"id": item["id"], "quantity": 3}])
+    client.post(f"/cart/{empty_cart_id}/add/{item_ids[0]}")
+    other_price = client.get(f"/item/{item_ids[0]}").json()["price"]
+
+    client.patch(f"/item/{item['id']}", json={"price": 12.5})
+    cart = client.get(f"/cart/{empty_cart_id}").json()
+    assert cart["price"] == pytest.approx(37.5 + other_price, 1e-8)
+
+    client.put(f"/item/{item['id']}", json={"name": "новое имя", "price": 20.0})
+    cart = client.get(f"/cart/{empty_cart_id}").json()
+    assert cart["price"] == pytest.approx(60.0 + other_price, 1e-8)
+    assert cart["items"][0]["name"] == "новое имя"
+
+    client.delete(f"/item/{item['id']}")
+    cart = client.get(f"/cart/{empty_cart_id}").json()
+    assert cart["price"] == pytest.approx(other_price, 1e-8)
+    assert cart["items"][0]["available"] is False
+    assert cart["items"][1]["available"] is True
+
+
 # Тесты для Item
 
 def test_create_item() -> None:
@@ -140,6 +241,37 @@ def test_create_item() -> None:
     assert response.json()["name"] == item["name"]
     assert response.json()["price"] == item["price"]
 
+def test_create_items_batch() -> None:
+    body = [{"name": f"batch {i}", "price": float(i + 1)} for i in range(5)]
+    response = client.post("/item/batch", json=body)
+    assert response.status_code == HTTPStatus.CREATED
+    created = response.json()
+    ids = [item["id"] for item in created]
+    assert ids == list(range(ids[0], ids[0] + len(body)))
+    assert [{"name": item["name"], "price": item["price"]} for item in created] == body
+    for item in created:
+        assert client.get(f"/item/{item['id']}").json() == item
+
+    response = client.post("/item/batch", json=[{"name": "ok", "price": 1.0}, {"price": 2.0}])
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_export_items(deleted_item: dict[str, Any]) -> None:
+    response = client.get("/item/export")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+
+    ids = [item["id"] for item in exported]
+    assert ids == sorted(ids)
+    assert deleted_item in exported
+    live = client.get("/item", params={"limit": 10_000}).json()
+    live.sort(key=lambda item: item["id"])
+    assert [item for item in exported if not item["deleted"]] == live
+    # выгрузка не оставляет сериализованный каталог в кэше фрагментов
+    assert len(main.store.item_json._fragments) < len(exported)
+
+
 def test_get_item(single_item: dict[str, Any]) -> None:
     item_id = single_item["id"]
     response = client.get(f"/item/{item_id}")
@@ -174,6 +306,137 @@ def test_get_item_list(params: dict[str, Any], expected_status: int) -> None:
         if "show_deleted" in params and not params["show_deleted"]:
             assert all(item["deleted"] is False for item in data)
 
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"min_price": 20.0, "max_price": 80.0},
+        {"show_deleted": True},
+        {"show_deleted": True, "min_price": 20.0},
+    ],
+)
+def test_get_item_list_pages(deleted_item: dict[str, Any], params: dict[str, Any]) -> None:
+    everything = client.get("/item", params={**params, "limit": 10_000}).json()
+    assert everything == sorted(everything, key=lambda item: (item["price"], item["id"]))
+    if params.get("show_deleted"):
+        assert deleted_item in everything or "min_price" in params
+    else:
+        assert not any(item["deleted"] for item in everything)
+
+    pages = []
+    for offset in range(0, len(everything) + 3, 3):
+        pages += client.get("/item", params={**params, "offset": offset, "limit": 3}).json()
+    assert pages == everything
+
+@pytest.mark.parametrize(
+    ("path", "params"),
+    [
+        ("/item", {}),
+        ("/item", {"show_deleted": True, "max_price": 300.0}),
+        ("/cart", {}),
+        ("/cart", {"min_quantity": 1}),
+        ("/cart", {"min_quantity": 1, "max_price": 300.0}),
+    ],
+)
+def test_cursor_pagination(deleted_item: dict[str, Any], path: str, params: dict[str, Any]) -> None:
+    everything = client.get(path, params={**params, "limit": 10_000}).json()
+
+    pages = []
+    response = client.get(path, params={**params, "limit": 4})
+    while True:
+        assert response.status_code == HTTPStatus.OK
+        pages += response.json()
+        if "x-next-cursor" not in response.headers:
+            break
+        cursor = response.headers["x-next-cursor"]
+        response = client.get(path, params={**params, "limit": 4, "cursor": cursor})
+
+    assert pages == everything
+
+
+def test_cart_cursor_keeps_order_while_carts_are_created() -> None:
+    store = Store()
+    items = [store.create_item(ItemCreate(name=f"item {i}", price=10.0 * i)) for i in range(1, 7)]
+    for i, item in enumerate(items, start=1):
+        store.add_to_cart(store.create_cart().id, [(item.id, 1)] * i)
+
+    # цены 20..60 шире количеств 1..4: первая страница идёт по количеству
+    filters = {"min_price": 20.0, "max_quantity": 4}
+    order, page = store.list_carts(0, 1, **filters)
+    assert order == CART_ORDER_QUANTITY
+    seen = [cart.id for _, cart in page]
+    while len(page) == 1:
+        # новые корзины с количеством 1 расширяют диапазон количеств
+        store.add_to_cart(store.create_cart().id, [(items[0].id, 1)])
+        key, cart = page[-1]
+        order, page = store.list_carts(0, 1, **filters, after=(order, key, cart.id))
+        seen += [cart.id for _, cart in page]
+
+    expected = [cart.id for _, cart in store.list_carts(0, 100, **filters)[1]]
+    assert sorted(seen) == sorted(expected) and len(seen) == len(expected)
+
+
+@pytest.mark.parametrize(
+    ("path", "cursor"),
+    [
+        ("/item", "not a cursor"),
+        ("/cart", "not a cursor"),
+        ("/item", encode_cursor(float("nan"), 1)),
+        ("/item", encode_cursor(1.0, 1.5)),
+        ("/item", encode_cursor(1.0, True)),
+        ("/cart", encode_cursor(0, float("inf"), float("inf"))),
+        ("/cart", encode_cursor(0.5, 1, 1)),
+    ],
+)
+def test_invalid_cursor(path: str, cursor: str) -> None:
+    response = client.get(path, params={"cursor": cursor})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_get_item_list_by_name() -> None:
+    token = uuid4().hex[:8]
+    names = [f"Green {token} Tea", f"green {token} coffee", f"Black {token} TEA", f"{token}-Straße"]
+    ids = [
+        client.post("/item", json={"name": name, "price": price}).json()["id"]
+        for name, price in zip(names, [30.0, 10.0, 20.0, 5.0])
+    ]
+
+    def search(**params) -> list[int]:
+        response = client.get("/item", params={"limit": 50, **params})
+        assert response.status_code == HTTPStatus.OK
+        return [item["id"] for item in response.json()]
+
+    assert search(name_contains=f"{token} tea") == [ids[2], ids[0]]
+    assert search(name_prefix=f"GREEN {token}") == [ids[1], ids[0]]
+    assert search(name_contains="tea", name_prefix=f"green {token}") == [ids[0]]
+    assert search(name_contains=f"{token}-strasse") == [ids[3]]
+    assert search(name_contains=f"{token} tea", max_price=25.0) == [ids[2]]
+    assert search(name_contains=token, limit=2, offset=1) == [ids[1], ids[2]]
+
+    client.patch(f"/item/{ids[1]}", json={"name": f"Green {token} tea, brewed"})
+    client.delete(f"/item/{ids[2]}")
+    assert search(name_contains=f"{token} tea") == [ids[1], ids[0]]
+    assert search(name_contains=f"{token} tea", show_deleted=True) == [ids[1], ids[2], ids[0]]
+    assert client.get("/item", params={"name_contains": ""}).status_code == (
+        HTTPStatus.UNPROCESSABLE_ENTITY
+    )
+
+
+def test_trigram_index_shares_postings_between_ids() -> None:
+    index = TrigramIndex()
+    index.add(1, "Green Tea")
+    index.add(2, "green tea")
+    index.add(3, "black tea")
+    assert index.search(contains="en t") == {1, 2}
+    assert index._postings["een"] == {"green tea"}
+
+    index.remove(1)
+    assert index.search(prefix="gr") == {2}
+    index.add(2, "oolong")
+    assert index.search(contains="tea") == {3}
+    assert "een" not in index._postings
+
+
 @pytest.mark.parametrize(
     ("body", "expected_status"),
     [
@@ -232,3 +495,283 @@ def test_delete_item(single_item: dict[str, Any]) -> None:
     assert response.status_code == HTTPStatus.NOT_FOUND
     response = client.delete(f"/item/{item_id}")
     assert response.status_code == HTTPStatus.OK
+
+
+# Статистика
+
+def test_stats_match_full_scan(empty_cart_id: int) -> None:
+    item_ids = [
+        client.post("/item", json={"name": faker.word(), "price": price}).json()["id"]
+        for price in (5.0, 10.0, 10.5, 999.0, 20000.0)
+    ]
+    client.post(f"/cart/{empty_cart_id}/add", json=[{"id": item_ids[0], "quantity": 3}])
+    client.post(f"/cart/{empty_cart_id}/add/{item_ids[3]}")
+    client.patch(f"/item/{item_ids[0]}", json={"price": 150.0})
+    client.delete(f"/item/{item_ids[3]}")
+
+    response = client.get("/stats")
+    assert response.status_code == HTTPStatus.OK
+    stats = response.json()
+
+    items = [json.loads(line) for line in client.get("/item/export").text.splitlines()]
+    live = [item for item in items if not item["deleted"]]
+    assert stats["live_items"] == len(live)
+    assert stats["deleted_items"] == len(items) - len(live)
+    bounds = [bucket["le"] for bucket in stats["price_histogram"]]
+    assert bounds[-1] is None
+    assert [bucket["count"] for bucket in stats["price_histogram"]] == [
+        sum(
+            (i == 0 or item["price"] > bounds[i - 1]) and (le is None or item["price"] <= le)
+            for item in live
+        )
+        for i, le in enumerate(bounds)
+    ]
+
+    carts = client.get("/cart", params={"limit": 10_000}).json()
+    assert stats["open_carts"] == len(carts)
+    assert stats["carts_value"] == pytest.approx(sum(cart["price"] for cart in carts))
+
+
+# Метрики Prometheus
+
+def test_metrics_endpoint(single_item: dict[str, Any], empty_cart_id: int) -> None:
+    if main.Instrumentator is None:
+        pytest.skip("prometheus-fastapi-instrumentator is not installed")
+    from prometheus_client import REGISTRY
+
+    def sample(name: str, **labels: str) -> float:
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    before = (
+        sample("hw2_store_scanned_entities_count", operation="list_items"),
+        sample("hw2_store_scanned_entities_count", operation="list_carts"),
+        sample("hw2_store_cart_lines_scanned_count"),
+    )
+    client.get(f"/item/{single_item['id']}")
+    client.get("/item", params={"limit": 5})
+    client.get("/cart", params={"limit": 5})
+    client.post(f"/cart/{empty_cart_id}/add/{single_item['id']}")
+    assert (
+        sample("hw2_store_scanned_entities_count", operation="list_items"),
+        sample("hw2_store_scanned_entities_count", operation="list_carts"),
+        sample("hw2_store_cart_lines_scanned_count"),
+    ) == tuple(count + 1 for count in before)
+
+    response = client.get("/metrics")
+    assert response.status_code == HTTPStatus.OK
+    assert 'http_request_duration_seconds_count{handler="/item/{id}",method="GET"' in response.text
+    assert 'hw2_serialization_seconds_count{encoder="json_response"}' in response.text
+    stats = client.get("/stats").json()
+    assert f'hw2_store_items{{state="live"}} {float(stats["live_items"])}' in response.text
+    assert f"hw2_store_carts {float(stats['open_carts'])}" in response.text
+
+
+# Конкурентные запросы
+
+def test_concurrent_writes_keep_ids_and_totals() -> None:
+    threads, per_thread = 8, 25
+
+    def create_item(_: int) -> dict[str, Any]:
+        return client.post("/item", json={"name": faker.word(), "price": 10.0}).json()
+
+    with ThreadPoolExecutor(threads) as pool:
+        created = list(pool.map(create_item, range(threads * per_thread)))
+    assert len({item["id"] for item in created}) == len(created)
+
+    cart_id = client.post("/cart").json()["id"]
+    item_ids = [item["id"] for item in created[:threads]]
+
+    def fill_cart(item_id: int) -> None:
+        for _ in range(per_thread):
+            client.post(f"/cart/{cart_id}/add/{item_id}")
+        client.post(f"/cart/{cart_id}/add", json=[{"id": item_id, "quantity": per_thread}])
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(fill_cart, item_ids))
+
+    cart = client.get(f"/cart/{cart_id}").json()
+    assert {line["id"]: line["quantity"] for line in cart["items"]} == {
+        item_id: 2 * per_thread for item_id in item_ids
+    }
+    assert cart["price"] == pytest.approx(threads * 2 * per_thread * 10.0)
+
+
+# Быстрая сериализация ответов
+
+def test_fast_json_matches_response_model(monkeypatch, empty_cart_id: int) -> None:
+    item_ids = [
+        client.post("/item", json={"name": name, "price": price}).json()["id"]
+        for name, price in [("чай \"улун\"", 12.5), ("tab\tline", 7.0), ("x", 0.3)]
+    ]
+    lines = [{"id": item_id, "quantity": 2} for item_id in item_ids]
+    client.post(f"/cart/{empty_cart_id}/add", json=lines)
+    paths = [
+        f"/item/{item_ids[0]}",
+        "/item?limit=2&max_price=50",
+        f"/cart/{empty_cart_id}",
+        "/cart?limit=3&min_quantity=1",
+    ]
+
+    def fetch_all(fast: bool) -> list:
+        monkeypatch.setattr(main, "FAST_JSON", fast)
+        responses = [client.get(path) for path in paths]
+        return [(r.content, r.headers.get("X-Next-Cursor")) for r in responses]
+
+    assert fetch_all(True) == fetch_all(False)
+    # кэш сбрасывается при изменении товара и корзин, в которых он лежит
+    client.patch(f"/item/{item_ids[0]}", json={"price": 13.5, "name": "green tea"})
+    client.delete(f"/item/{item_ids[1]}")
+    client.post(f"/cart/{empty_cart_id}/add/{item_ids[2]}")
+    assert fetch_all(True) == fetch_all(False)
+
+
+@pytest.mark.parametrize("price", [0.0, -0.0, 1e-05, 9.9e-05, 1e16, 1.5e300, 123.456, -7.25])
+def test_fast_json_dumps_floats_like_json(price: float) -> None:
+    item = Item(id=1, name="item", price=price)
+    expected = json.dumps(item.model_dump(), ensure_ascii=False, separators=(",", ":"))
+    assert fast_json.dumps(item) == expected.encode()
+
+
+# Колоночное хранилище товаров
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_columnar_store_lists_like_store(monkeypatch, use_numpy: bool) -> None:
+    if not use_numpy:
+        monkeypatch.setattr(columnar, "np", None)
+    elif columnar.np is None:
+        pytest.skip("numpy is not installed")
+
+    store, columnar_store = Store(), columnar.ColumnarStore()
+    for i in range(60):
+        item_data = ItemCreate(name=faker.word(), price=float(i % 7 + 1), deleted=i % 5 == 0)
+        store.create_item(item_data)
+        columnar_store.create_item(item_data)
+    for item_id in (3, 8, 9):
+        store.delete_item(item_id)
+        columnar_store.delete_item(item_id)
+
+    for params in [
+        {},
+        {"offset": 7, "limit": 9},
+        {"min_price": 2.0, "max_price": 5.0, "limit": 20},
+        {"show_deleted": True, "offset": 3, "limit": 30},
+        {"after": (4.0, 25), "limit": 12},
+        {"after": (4.0, 25), "show_deleted": True, "min_price": 3.0, "limit": 50},
+        {"name_contains": "e", "show_deleted": True, "limit": 30},
+        {"name_prefix": "s", "max_price": 6.0, "limit": 30},
+    ]:
+        params = {"offset": 0, "limit": 10, **params}
+        assert columnar_store.list_items(**params) == store.list_items(**params)
+    assert columnar_store.get_item(3) is None
+    assert columnar_store.delete_item(3).deleted
+
+
+# Восстановление из журнала и снимка
+
+@pytest.mark.parametrize("snapshot_bytes", [2**30, 256])
+def test_durable_store_recovers_state(tmp_path, snapshot_bytes: int) -> None:
+    store = DurableStore(str(tmp_path), snapshot_bytes)
+    items = [
+        store.create_item(ItemCreate(name=faker.word(), price=price)) for price in (10.0, 20.0, 30.0)
+    ]
+    cart = store.create_cart()
+    store.add_to_cart(cart.id, [(items[0].id, 2), (items[1].id, 1)])
+    store.patch_item(items[0].id, ItemPatch(price=15.0))
+    store.delete_item(items[1].id)
+    store.update_item(items[2].id, ItemCreate(name="renamed", price=5.0))
+    store.add_to_cart(cart.id, [(items[2].id, 3)])
+    store.close()
+    assert (tmp_path / "snapshot.bin").exists() == (snapshot_bytes < 2**30)
+
+    recovered = DurableStore(str(tmp_path), snapshot_bytes)
+    assert recovered.items == store.items
+    assert recovered.get_cart(cart.id) == store.get_cart(cart.id)
+    assert recovered.get_cart(cart.id).total_quantity == 6
+    assert recovered.list_carts(0, 10, min_price=45.0) == store.list_carts(0, 10, min_price=45.0)
+    assert recovered.get_stats() == store.get_stats()
+    assert recovered.create_item(ItemCreate(name="next", price=1.0)).id == items[-1].id + 1
+    assert recovered.create_cart().id == cart.id + 1
+
+
+def test_durable_store_recovers_unfinished_snapshot(tmp_path, monkeypatch) -> None:
+    store = DurableStore(str(tmp_path))
+    item = store.create_item(ItemCreate(name="kept", price=1.0))
+    cart = store.create_cart()
+    store.add_to_cart(cart.id, [(item.id, 2)])
+
+    def crash(*args) -> None:
+        raise OSError("crashed before rename")
+
+    # журнал уже переключён на wal-1.log, а снимок 1 так и не лёг на место
+    monkeypatch.setattr(durable_store, "write_snapshot", crash)
+    with pytest.raises(OSError):
+        store.snapshot()
+    monkeypatch.undo()
+    store.add_to_cart(cart.id, [(item.id, 1)])
+    store.patch_item(item.id, ItemPatch(price=3.0))
+    store.close()
+    assert sorted(os.listdir(tmp_path)) == ["wal-0.log", "wal-1.log"]
+
+    recovered = DurableStore(str(tmp_path))
+    assert recovered.items == store.items
+    assert recovered.get_cart(cart.id) == store.get_cart(cart.id)
+    assert recovered.get_stats() == store.get_stats()
+    assert sorted(os.listdir(tmp_path)) == ["snapshot.bin", "wal-2.log"]
+
+
+def test_durable_store_snapshot_keeps_carts_at_log_switch(tmp_path, monkeypatch) -> None:
+    store = DurableStore(str(tmp_path))
+    item = store.create_item(ItemCreate(name="kept", price=2.0))
+    first, second = store.create_cart(), store.create_cart()
+    for cart in (first, second):
+        store.add_to_cart(cart.id, [(item.id, 1)])
+    cart_row = durable_store._cart_row
+
+    def change_second_cart(cart):
+        if cart.id == first.id and store._pending_carts == {}:
+            # строки уже собираются, а до второй корзины снимок ещё не дошёл
+            store.add_to_cart(second.id, [(item.id, 5)])
+        return cart_row(cart)
+
+    monkeypatch.setattr(durable_store, "_cart_row", change_second_cart)
+    store.snapshot()
+    store.close()
+
+    recovered = DurableStore(str(tmp_path))
+    assert recovered.get_cart(second.id) == store.get_cart(second.id)
+    assert recovered.get_cart(second.id).total_quantity == 6
+
+
+def test_wal_failed_write_is_never_durable(tmp_path) -> None:
+    log = WriteAheadLog(str(tmp_path / "wal.log"))
+    first, second = log.append(b"first"), log.append(b"second")
+    real_file = log._file
+
+    class FullDisk:
+        def write(self, data: bytes) -> None:
+            raise OSError(28, "No space left on device")
+
+    log._file = FullDisk()
+    with pytest.raises(OSError):
+        log.sync(first)
+    log._file = real_file
+    # следующий лидер не должен объявить записи сохранёнными по пустому буферу
+    with pytest.raises(OSError):
+        log.sync(second)
+    with pytest.raises(OSError):
+        log.close()
+    assert read_log(str(tmp_path / "wal.log")) == ([], 0)
+
+
+def test_durable_store_ignores_torn_record(tmp_path) -> None:
+    store = DurableStore(str(tmp_path))
+    item = store.create_item(ItemCreate(name="kept", price=1.0))
+    store.close()
+    with open(tmp_path / "wal-0.log", "ab") as log:
+        log.write(b"\x10\x00\x00\x00torn")
+
+    recovered = DurableStore(str(tmp_path))
+    assert recovered.get_item(item.id) == item
+    second = recovered.create_item(ItemCreate(name="appended", price=2.0))
+    recovered.close()
+    assert DurableStore(str(tmp_path)).get_item(second.id) == second
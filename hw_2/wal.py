@@ -0,0 +1,231 @@
+import mmap
+import os
+import struct
+import zlib
+from threading import Condition, Lock
+from typing import List, Optional, Tuple
+
+from schemas import Item
+
+# Запись журнала: длина и crc32 полезной нагрузки, первый байт нагрузки — тип операции
+RECORD_HEADER = struct.Struct("<II")
+OP_ITEM, OP_CART, OP_CART_ADD = range(1, 4)
+
+ITEM = struct.Struct("<Bqd?I")
+CART = struct.Struct("<Bq")
+CART_ADD = struct.Struct("<BqI")
+CART_LINE = struct.Struct("<qq")
+
+# Снимок: заголовок, затем товары (id, price, deleted, длина имени, имя)
+# и корзины (id, price, число позиций, позиции (item_id, quantity))
+SNAPSHOT_MAGIC = b"HW2S"
+SNAPSHOT_HEADER = struct.Struct("<4sQQQ")
+SNAPSHOT_ITEM = struct.Struct("<qd?I")
+SNAPSHOT_CART = struct.Struct("<qdI")
+SNAPSHOT_CHUNK_SIZE = 2**20
+
+_fsync = getattr(os, "fdatasync", os.fsync)
+
+
+def encode_item(item: Item) -> bytes:
+    """Record setting the full state of an item: create, put, patch or delete."""
+    name = item.name.encode()
+    return ITEM.pack(OP_ITEM, item.id, item.price, item.deleted, len(name)) + name
+
+
+def encode_cart(cart_id: int) -> bytes:
+    return CART.pack(OP_CART, cart_id)
+
+
+def encode_cart_add(cart_id: int, lines: List[Tuple[int, int]]) -> bytes:
+    return CART_ADD.pack(OP_CART_ADD, cart_id, len(lines)) + b"".join(
+        CART_LINE.pack(item_id, quantity) for item_id, quantity in lines
+    )
+
+
+def decode_record(payload: memoryview) -> tuple:
+    """(OP_ITEM, Item) | (OP_CART, cart_id) | (OP_CART_ADD, cart_id, lines)."""
+    op = payload[0]
+    if op == OP_ITEM:
+        _, id, price, deleted, name_size = ITEM.unpack_from(payload)
+        name = bytes(payload[ITEM.size:ITEM.size + name_size]).decode()
+        return op, Item(id=id, name=name, price=price, deleted=deleted)
+    if op == OP_CART:
+        return op, CART.unpack_from(payload)[1]
+    _, cart_id, count = CART_ADD.unpack_from(payload)
+    lines = [
+        CART_LINE.unpack_from(payload, CART_ADD.size + i * CART_LINE.size) for i in range(count)
+    ]
+    return op, cart_id, lines
+
+
+def read_log(path: str) -> Tuple[List[memoryview], int]:
+    """Payloads of the intact records and the length of the intact prefix.
+
+    Reading stops at the first torn or corrupted record, which is what a
+    crash in the middle of a write leaves behind.
+    """
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return [], 0
+    with open(path, "rb") as file:
+        data = memoryview(file.read())
+    payloads = []
+    position = 0
+    while position + RECORD_HEADER.size <= len(data):
+        size, checksum = RECORD_HEADER.unpack_from(data, position)
+        start = position + RECORD_HEADER.size
+        payload = data[start:start + size]
+        if len(payload) < size or zlib.crc32(payload) != checksum:
+            break
+        payloads.append(payload)
+        position = start + size
+    return payloads, position
+
+
+class WriteAheadLog:
+    """Append-only log with group commit.
+
+    ``append`` only buffers a record and returns its sequence number;
+    ``sync`` makes the record durable. The first thread to sync becomes the
+    leader and writes and fsyncs everything buffered so far, while the
+    threads that arrive meanwhile wait for it and are usually covered by
+    that one fsync instead of issuing their own.
+
+    If a write or fsync fails, part of the buffer may or may not be on disk,
+    so the log stops accepting syncs: every later ``sync`` raises instead of
+    reporting records durable that were never written.
+    """
+
+    def __init__(self, path: str, valid_size: Optional[int] = None, seq: int = 0):
+        self.path = path
+        self._file = open(path, "ab")
+        if valid_size is not None:
+            # отрезаем оборванную запись, оставшуюся после падения
+            self._file.truncate(valid_size)
+        self.size = os.path.getsize(path)
+        self._buffer = bytearray()
+        # номера записей продолжаются между файлами, чтобы sync по номеру из
+        # прошлого файла сразу возвращался
+        self._appended = seq
+        self._durable = seq
+        self._flushing = False
+        self._error: Optional[BaseException] = None
+        self._lock = Lock()
+        self._synced = Condition(self._lock)
+
+    def append(self, payload: bytes) -> int:
+        with self._lock:
+            self._buffer += RECORD_HEADER.pack(len(payload), zlib.crc32(payload))
+            self._buffer += payload
+            self.size += RECORD_HEADER.size + len(payload)
+            self._appended += 1
+            return self._appended
+
+    def sync(self, seq: int) -> None:
+        with self._synced:
+            while self._durable < seq:
+                if self._error is not None:
+                    raise OSError(f"Write-ahead log {self.path} failed") from self._error
+                if self._flushing:
+                    self._synced.wait()
+                    continue
+                self._flushing = True
+                data, target = bytes(self._buffer), self._appended
+                self._buffer.clear()
+                error = None
+                self._lock.release()
+                try:
+                    self._file.write(data)
+                    self._file.flush()
+                    _fsync(self._file.fileno())
+                except BaseException as exc:
+                    error = exc
+                    raise
+                finally:
+                    self._lock.acquire()
+                    self._flushing = False
+                    if error is None:
+                        self._durable = target
+                    else:
+                        self._error = error
+                    self._synced.notify_all()
+
+    @property
+    def seq(self) -> int:
+        return self._appended
+
+    def close(self) -> None:
+        try:
+            self.sync(self._appended)
+        finally:
+            self._file.close()
+
+
+def write_snapshot(
+    path: str,
+    items: List[Tuple[int, str, float, bool]],
+    carts: List[Tuple[int, float, List[Tuple[int, int]]]],
+    generation: int,
+) -> None:
+    """Write item rows and cart rows to a snapshot atomically.
+
+    Items come as (id, name, price, deleted), carts as read_snapshot
+    returns them. The data goes to a temporary file that is fsynced and
+    renamed over ``path``, so a crash leaves either the old snapshot or
+    the new one.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        buffer = bytearray(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(items), len(carts)))
+        for id, name, price, deleted in items:
+            name = name.encode()
+            buffer += SNAPSHOT_ITEM.pack(id, price, deleted, len(name))
+            buffer += name
+            if len(buffer) >= SNAPSHOT_CHUNK_SIZE:
+                file.write(buffer)
+                buffer.clear()
+        for id, price, lines in carts:
+            buffer += SNAPSHOT_CART.pack(id, price, len(lines))
+            for line in lines:
+                buffer += CART_LINE.pack(*line)
+            if len(buffer) >= SNAPSHOT_CHUNK_SIZE:
+                file.write(buffer)
+                buffer.clear()
+        file.write(buffer)
+        file.flush()
+        _fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Tuple[int, List[Item], List[tuple]]:
+    """(generation, items, carts) of a snapshot, read through mmap.
+
+    Carts come as (id, price, [(item_id, quantity)]).
+    """
+    if not os.path.exists(path):
+        return 0, [], []
+    with open(path, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, generation, item_count, cart_count = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a snapshot")
+
+    position = SNAPSHOT_HEADER.size
+    items = []
+    for _ in range(item_count):
+        id, price, deleted, name_size = SNAPSHOT_ITEM.unpack_from(data, position)
+        position += SNAPSHOT_ITEM.size
+        name = data[position:position + name_size].decode()
+        position += name_size
+        items.append(Item(id=id, name=name, price=price, deleted=deleted))
+    carts = []
+    for _ in range(cart_count):
+        id, price, count = SNAPSHOT_CART.unpack_from(data, position)
+        position += SNAPSHOT_CART.size
+        lines = [
+            CART_LINE.unpack_from(data, position + i * CART_LINE.size) for i in range(count)
+        ]
+        position += count * CART_LINE.size
+        carts.append((id, price, lines))
+    data.close()
+    return generation, items, carts